@@ -2,19 +2,41 @@ import json
 import time
 import requests
 
+from ai import cache, client, retry, telemetry
 from helpers import log
 
-def send_request(system_instruction, command, api_key, model):
-    max_retries = 3
-    wait_time = 5  # Seconds
+GENERATION_PARAMS = {
+    "max_tokens": 4000,
+    "temperature": 0.7
+}
 
-    retry_count = 0
+def parse_stream_event(event):
+    if event["type"] == "error":
+        raise client.StreamError(json.dumps(event["error"]))
+    if event["type"] == "message_start":
+        return "", event["message"]["usage"]
+    if event["type"] == "message_delta":
+        return "", event.get("usage")
+    if event["type"] == "content_block_delta" and event["delta"]["type"] == "text_delta":
+        return event["delta"]["text"], None
+    return "", None
 
-    while retry_count < max_retries:
-        if retry_count > 0:
+def build_streamed_response(message, usage):
+    return {
+        "content": [{ "text": message }],
+        "usage": usage
+    }
+
+def send_request(system_instruction, command, api_key, model, stream_file=None, cancel_event=None, context=None):
+    policy = retry.RetryPolicy(cancel_event=cancel_event)
+    partial_message = ""
+    call_start_time = time.monotonic()
+
+    while policy.next_attempt():
+        if policy.attempt == 1:
             log(f"Generating response with {model}...", "info")
-        elif retry_count >= 1:
-            log(f"Attempt {retry_count + 1} of {max_retries} to generate response with {model}...", "info")
+        else:
+            log(f"Attempt {policy.attempt} of {policy.max_attempts} to generate response with {model}...", "info")
 
         try:
             endpoint = "https://api.anthropic.com/v1/messages"
@@ -24,40 +46,81 @@ def send_request(system_instruction, command, api_key, model):
                 "anthropic-version": "2023-06-01"
             }
 
+            # The static instructions come first, then the context shared by the calls of a run, like the commit info
+            # that every chunk of a changelog is sent with. The cache breakpoint ends on the last shared block,
+            # Anthropic only caches prefixes of at least 1024 tokens.
+            system = [
+                {
+                    "type": "text",
+                    "text": system_instruction
+                }
+            ]
+            content = [
+                {
+                    "type": "text",
+                    "text": command
+                }
+            ]
+            if context:
+                content.insert(0, { "type": "text", "text": context, "cache_control": { "type": "ephemeral" } })
+            else:
+                system[0]["cache_control"] = { "type": "ephemeral" }
+
             payload = {
                 "model": model,
-                "max_tokens": 4000,
-                "temperature": 0.7,
-                "system": system_instruction,
+                **GENERATION_PARAMS,
+                "system": system,
                 "messages": [
                     {
                         "role": "user",
-                        "content": command
+                        "content": content
                     }
                 ]
             }
 
-            response = requests.post(
+            if stream_file:
+                payload["stream"] = True
+
+            start_time = time.monotonic()
+            response = client.post(
                 endpoint,
                 headers=headers,
                 json=payload,
-                timeout=300  # 5 minutes
+                stream=stream_file is not None,
+                timeout=policy.timeout(300)  # 5 minutes at most
             )
 
             response.raise_for_status()
-            response_data = response.json()
+
+            if stream_file:
+                message, usage = client.stream_text(response, stream_file, parse_stream_event, start_time, cancel_event)
+                response_data = build_streamed_response(message, usage)
+            else:
+                response_data = response.json()
 
             try:
                 message = response_data['content'][0]['text']
-                input_tokens = response_data['usage']['input_tokens']
+                cache_read_tokens = response_data['usage'].get('cache_read_input_tokens') or 0
+                cache_creation_tokens = response_data['usage'].get('cache_creation_input_tokens') or 0
+                # Anthropic reports uncached input tokens separately from cache reads and writes
+                input_tokens = response_data['usage']['input_tokens'] + cache_read_tokens + cache_creation_tokens
                 output_tokens = response_data['usage']['output_tokens']
 
                 if message:
                     log(f"Model: {model}", "info")
                     log(f"Input tokens: {input_tokens}", "info")
+                    log(f"Cached tokens: {cache_read_tokens} ({cache_creation_tokens} written to cache)", "info")
+                    log(f"Cache hit ratio: {client.cache_hit_ratio(cache_read_tokens, input_tokens):.0%}", "info")
                     log(f"Output tokens: {output_tokens}", "info")
                     log(f"\n{message}")
 
+                    telemetry.record("anthropic", model, policy.attempt, time.monotonic() - call_start_time, {
+                        "input_tokens": input_tokens,
+                        "cached_tokens": cache_read_tokens,
+                        "cache_write_tokens": cache_creation_tokens,
+                        "output_tokens": output_tokens
+                    })
+
                     return {
                         "error": False,
                         "message": message
@@ -68,22 +131,33 @@ def send_request(system_instruction, command, api_key, model):
                 log(f"Failed to parse API response: {e}", "error")
                 log(f"Response content: {json.dumps(response_data, indent=2)}", "error")
 
+        except client.StreamError as e:
+            log(f"Stream interrupted after {len(e.partial_message)} characters: {e}", "error")
+            if len(e.partial_message) > len(partial_message):
+                partial_message = e.partial_message
+
         except requests.exceptions.RequestException as e:
             log(f"Request failed: {e}", "error")
-            if hasattr(e, 'response') and e.response:
+            if e.response is not None:
                 try:
                     error_details = e.response.json()
                     log(f"{json.dumps(error_details, indent=2)}", "error")
-                except:
+                except ValueError:
                     log(f"{e.response.text}", "error")
+            policy.record_failure(e.response)
 
-        retry_count += 1
-        if retry_count < max_retries:
-            log(f"Waiting {wait_time} seconds before retry...", "info")
-            time.sleep(wait_time)
-
-    log(f"Failed to get valid response after {max_retries} retries.", "error")
+    if policy.is_cancelled():
+        log(f"Request to {model} was cancelled.", "info")
+    else:
+        log(f"Failed to get valid response after {policy.attempt} attempt(s).", "error")
+    telemetry.record("anthropic", model, policy.attempt, time.monotonic() - call_start_time, error=True, partial=bool(partial_message))
+    if partial_message:
+        return { "error": True, "partial": True, "message": partial_message }
     return { "error": True }
 
-def generate_text(model, system_instruction, command, api_key):
-    return send_request(system_instruction, command, api_key, model)
\ No newline at end of file
+def generate_text(model, system_instruction, command, api_key, stream_file=None, cancel_event=None, context=None):
+    return cache.cached(
+        "anthropic", model, system_instruction, command, GENERATION_PARAMS,
+        lambda: send_request(system_instruction, command, api_key, model, stream_file, cancel_event, context),
+        context
+    )
\ No newline at end of file
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from ai import telemetry
+from helpers import log
+
+DEFAULT_CACHE_DIR = os.path.join(".github", ".ai-cache")
+DEFAULT_TTL = 7 * 24 * 60 * 60  # 7 days
+DEFAULT_MAX_ENTRIES = 200
+
+_config = {
+    "enabled": True,
+    "cache_dir": DEFAULT_CACHE_DIR,
+    "ttl": DEFAULT_TTL,
+    "max_entries": DEFAULT_MAX_ENTRIES
+}
+
+def configure(enabled=True, cache_dir=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+    _config["enabled"] = enabled
+    _config["cache_dir"] = cache_dir or DEFAULT_CACHE_DIR
+    _config["ttl"] = ttl
+    _config["max_entries"] = max_entries
+
+# Hash everything that influences the generated text
+def make_key(provider, model, system_instruction, command, params, context=None):
+    material = json.dumps({
+        "provider": provider,
+        "model": model,
+        "system_instruction": system_instruction,
+        "context": context,
+        "command": command,
+        "params": params
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def _entry_path(key):
+    return os.path.join(_config["cache_dir"], f"{key}.json")
+
+# Other writers may have removed or replaced the entry in the meantime
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def get(key):
+    path = _entry_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if time.time() - entry.get("created_at", 0) > _config["ttl"]:
+        _remove(path)
+        return None
+
+    # Touch the entry so eviction treats it as recently used
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return entry["response"]
+
+def put(key, response):
+    os.makedirs(_config["cache_dir"], exist_ok=True)
+    path = _entry_path(key)
+    # A unique temp file per write, threads of one process write concurrently too
+    fd, temp_path = tempfile.mkstemp(dir=_config["cache_dir"], suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({ "created_at": time.time(), "response": response }, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        _remove(temp_path)
+        raise
+    evict()
+
+# Drop expired entries, then the least recently used ones until the cache fits
+def evict():
+    now = time.time()
+    entries = []
+    for name in os.listdir(_config["cache_dir"]):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(_config["cache_dir"], name)
+        try:
+            last_used = os.path.getmtime(path)
+        except FileNotFoundError:
+            continue
+        if now - last_used > _config["ttl"]:
+            _remove(path)
+        else:
+            entries.append((last_used, path))
+
+    entries.sort()
+    while len(entries) > _config["max_entries"]:
+        _, path = entries.pop(0)
+        _remove(path)
+
+def cached(provider, model, system_instruction, command, params, generate, context=None):
+    if not _config["enabled"]:
+        return generate()
+
+    key = make_key(provider, model, system_instruction, command, params, context)
+    response = get(key)
+    if response is not None:
+        log(f"Using cached response for {provider}/{model} ({key[:12]}).", "info")
+        log(f"\n{response['message']}")
+        telemetry.record(provider, model, cache_hit=True)
+        return response
+
+    response = generate()
+    if response["error"] is False:
+        put(key, response)
+
+    return response
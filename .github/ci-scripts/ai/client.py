@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from helpers import log
+
+# Number of connections kept alive per host, can be overridden from the workflow
+DEFAULT_POOL_SIZE = int(os.environ.get("AI_HTTP_POOL_SIZE", "10"))
+
+_session = None
+_session_lock = threading.Lock()
+
+# Timings of the request currently made by each thread
+_timings = threading.local()
+
+def _record_timing(name, seconds):
+    timings = getattr(_timings, "current", None)
+    if timings is not None:
+        timings[name] = seconds
+
+# Times the connect of every new connection, including the DNS lookup urllib3 does as part of it
+class TimedConnectionMixin:
+    def _new_conn(self):
+        start_time = time.monotonic()
+        sock = super()._new_conn()
+        _record_timing("connect", time.monotonic() - start_time)
+        return sock
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    # Everything after the connect is the TLS handshake
+    def connect(self):
+        start_time = time.monotonic()
+        super().connect()
+        timings = getattr(_timings, "current", None) or {}
+        _record_timing("tls", time.monotonic() - start_time - timings.get("connect", 0))
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool
+        }
+
+# Create a session that keeps connections alive between requests
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({ "Connection": "keep-alive" })
+    return session
+
+# Shared session used by all providers, so retries and consecutive calls reuse warm connections
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+# Replace the shared session, e.g. to change the pool size
+def configure(pool_size=DEFAULT_POOL_SIZE):
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = create_session(pool_size)
+
+def close():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+# Post a request, recording its timings for get_timings.
+# Connect and TLS timings are only present when a new connection had to be opened.
+def post(url, **kwargs):
+    _timings.current = {}
+    response = get_session().post(url, **kwargs)
+    # Elapsed time until the response headers arrived
+    _record_timing("ttfb", response.elapsed.total_seconds())
+    return response
+
+# Timings of the last request made by the current thread, in seconds
+def get_timings():
+    return dict(getattr(_timings, "current", None) or {})
+
+# Share of the prompt tokens that were served from the provider's prompt cache
+def cache_hit_ratio(cached_tokens, input_tokens):
+    return cached_tokens / input_tokens if input_tokens else 0
+
+# Raised when a provider reports an error inside an event stream
+class StreamError(Exception):
+    def __init__(self, message, partial_message=""):
+        super().__init__(message)
+        self.partial_message = partial_message
+
+# Yield the data of each server-sent event
+def iter_sse(response):
+    # Event streams are UTF-8, even when the content type does not name a charset
+    response.encoding = "utf-8"
+    data_lines = []
+    # Read data as soon as it arrives instead of waiting for fixed size blocks
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+        elif line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+    if data_lines:
+        yield "\n".join(data_lines)
+
+# Read a streamed response, writing the text to the stream file as it arrives.
+# If the stream breaks off or is cancelled, the text received so far is kept in the raised StreamError.
+def stream_text(response, stream_file, parse_event, start_time, cancel_event=None):
+    chunks = []
+    usage = {}
+    first_token_time = None
+
+    with open(stream_file, "w", encoding="utf-8") as f:
+        try:
+            for data in iter_sse(response):
+                if data == "[DONE]":
+                    break
+                if cancel_event is not None and cancel_event.is_set():
+                    response.close()
+                    raise StreamError("Stream cancelled")
+
+                text, event_usage = parse_event(json.loads(data))
+                if event_usage:
+                    usage.update(event_usage)
+
+                if text:
+                    if first_token_time is None:
+                        first_token_time = time.monotonic() - start_time
+                        log(f"Time to first token: {first_token_time:.2f}s", "info")
+                        _record_timing("ttft", first_token_time)
+                    chunks.append(text)
+                    f.write(text)
+                    f.flush()
+        # Events of an unexpected shape break off the stream like a dropped connection
+        except (requests.exceptions.RequestException, ValueError, KeyError, IndexError, TypeError, StreamError) as e:
+            raise StreamError(str(e), "".join(chunks)) from e
+
+    return "".join(chunks), usage
@@ -2,28 +2,45 @@ import json
 import time
 import requests
 
+from ai import cache, client, retry, telemetry
 from helpers import log
 
-def send_request(system_instruction, command, api_key, model):
-    max_retries = 3
-    wait_time = 5  # Seconds
+GENERATION_PARAMS = {
+    "maxOutputTokens": 4000
+}
 
-    retry_count = 0
+def parse_stream_event(event):
+    text = ""
+    if event.get("candidates"):
+        parts = event["candidates"][0].get("content", {}).get("parts", [])
+        text = "".join(part.get("text", "") for part in parts)
+    return text, event.get("usageMetadata")
 
-    while retry_count < max_retries:
-        if retry_count > 0:
+def build_streamed_response(message, usage):
+    return {
+        "candidates": [{ "content": { "parts": [{ "text": message }] } }],
+        "usageMetadata": usage
+    }
+
+def send_request(system_instruction, command, api_key, model, stream_file=None, cancel_event=None, context=None):
+    policy = retry.RetryPolicy(cancel_event=cancel_event)
+    partial_message = ""
+    call_start_time = time.monotonic()
+
+    while policy.next_attempt():
+        if policy.attempt == 1:
             log(f"Generating response with {model}...", "info")
-        elif retry_count >= 1:
-            log(f"Attempt {retry_count + 1} of {max_retries} to generate response with {model}...", "info")
+        else:
+            log(f"Attempt {policy.attempt} of {policy.max_attempts} to generate response with {model}...", "info")
 
         try:
-            endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+            method = "streamGenerateContent" if stream_file else "generateContent"
+            endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:{method}"
+            params = { "alt": "sse", "key": api_key } if stream_file else { "key": api_key }
             headers = { "Content-Type": "application/json" }
 
             payload = {
-                "generationConfig": {
-                    "maxOutputTokens": 4000
-                },
+                "generationConfig": GENERATION_PARAMS,
                 "system_instruction": {
                     "parts": [
                         {
@@ -41,28 +58,48 @@ def send_request(system_instruction, command, api_key, model):
                     }
                 ]
             }
+            # The context shared by the calls of a run right after the static instructions, for implicit prefix caching
+            if context:
+                payload["contents"][0]["parts"].insert(0, { "text": context })
 
-            response = requests.post(
-                f"{endpoint}?key={api_key}",
+            start_time = time.monotonic()
+            response = client.post(
+                endpoint,
+                params=params,
                 headers=headers,
                 json=payload,
-                timeout=300  # 5 minutes
+                stream=stream_file is not None,
+                timeout=policy.timeout(300)  # 5 minutes at most
             )
 
             response.raise_for_status()
-            response_data = response.json()
+
+            if stream_file:
+                message, usage = client.stream_text(response, stream_file, parse_stream_event, start_time, cancel_event)
+                response_data = build_streamed_response(message, usage)
+            else:
+                response_data = response.json()
 
             try:
-                message = response_data['content'][0]['text']
-                input_tokens = response_data['usage']['input_tokens']
-                output_tokens = response_data['usage']['output_tokens']
+                message = "".join(part.get('text', '') for part in response_data['candidates'][0]['content']['parts'])
+                input_tokens = response_data['usageMetadata']['promptTokenCount']
+                cached_tokens = response_data['usageMetadata'].get('cachedContentTokenCount') or 0
+                output_tokens = response_data['usageMetadata']['candidatesTokenCount']
 
                 if message:
                     log(f"Model: {model}", "info")
                     log(f"Input tokens: {input_tokens}", "info")
+                    log(f"Cached tokens: {cached_tokens}", "info")
+                    log(f"Cache hit ratio: {client.cache_hit_ratio(cached_tokens, input_tokens):.0%}", "info")
                     log(f"Output tokens: {output_tokens}", "info")
                     log(f"\n{message}")
 
+                    telemetry.record("gemini", model, policy.attempt, time.monotonic() - call_start_time, {
+                        "input_tokens": input_tokens,
+                        "cached_tokens": cached_tokens,
+                        "output_tokens": output_tokens
+                    })
+
                     return {
                         "error": False,
                         "message": message
@@ -73,22 +110,33 @@ def send_request(system_instruction, command, api_key, model):
                 log(f"Failed to parse API response: {e}", "error")
                 log(f"Response content: {json.dumps(response_data, indent=2)}", "error")
 
+        except client.StreamError as e:
+            log(f"Stream interrupted after {len(e.partial_message)} characters: {e}", "error")
+            if len(e.partial_message) > len(partial_message):
+                partial_message = e.partial_message
+
         except requests.exceptions.RequestException as e:
             log(f"Request failed: {e}", "error")
-            if hasattr(e, 'response') and e.response:
+            if e.response is not None:
                 try:
                     error_details = e.response.json()
                     log(f"{json.dumps(error_details, indent=2)}", "error")
-                except:
+                except ValueError:
                     log(f"{e.response.text}", "error")
+            policy.record_failure(e.response)
 
-        retry_count += 1
-        if retry_count < max_retries:
-            log(f"Waiting {wait_time} seconds before retry...", "info")
-            time.sleep(wait_time)
-
-    log(f"Failed to get valid response after {max_retries} retries.", "error")
+    if policy.is_cancelled():
+        log(f"Request to {model} was cancelled.", "info")
+    else:
+        log(f"Failed to get valid response after {policy.attempt} attempt(s).", "error")
+    telemetry.record("gemini", model, policy.attempt, time.monotonic() - call_start_time, error=True, partial=bool(partial_message))
+    if partial_message:
+        return { "error": True, "partial": True, "message": partial_message }
     return { "error": True }
 
-def generate_text(model, system_instruction, command, api_key):
-    return send_request(system_instruction, command, api_key, model)
\ No newline at end of file
+def generate_text(model, system_instruction, command, api_key, stream_file=None, cancel_event=None, context=None):
+    return cache.cached(
+        "gemini", model, system_instruction, command, GENERATION_PARAMS,
+        lambda: send_request(system_instruction, command, api_key, model, stream_file, cancel_event, context),
+        context
+    )
\ No newline at end of file
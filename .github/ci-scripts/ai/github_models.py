@@ -2,19 +2,36 @@ import json
 import time
 import requests
 
+from ai import cache, client, retry, telemetry
 from helpers import log
 
-def send_request(system_instruction, command, api_key, model):
-    max_retries = 3
-    wait_time = 5  # Seconds
+GENERATION_PARAMS = {
+    "max_tokens": 4000,
+    "temperature": 0.7
+}
 
-    retry_count = 0
+def parse_stream_event(event):
+    text = ""
+    if event.get("choices"):
+        text = event["choices"][0]["delta"].get("content") or ""
+    return text, event.get("usage")
 
-    while retry_count < max_retries:
-        if retry_count > 0:
+def build_streamed_response(message, usage):
+    return {
+        "choices": [{ "message": { "content": message } }],
+        "usage": usage
+    }
+
+def send_request(system_instruction, command, api_key, model, stream_file=None, cancel_event=None, context=None):
+    policy = retry.RetryPolicy(cancel_event=cancel_event)
+    partial_message = ""
+    call_start_time = time.monotonic()
+
+    while policy.next_attempt():
+        if policy.attempt == 1:
             log(f"Generating response with {model}...", "info")
-        elif retry_count >= 1:
-            log(f"Attempt {retry_count + 1} of {max_retries} to generate response with {model}...", "info")
+        else:
+            log(f"Attempt {policy.attempt} of {policy.max_attempts} to generate response with {model}...", "info")
 
         try:
             endpoint = f"https://models.github.ai/inference/chat/completions"
@@ -25,8 +42,7 @@ def send_request(system_instruction, command, api_key, model):
 
             payload = {
                 "model": model,
-                "max_tokens": 4000,
-                "temperature": 0.7,
+                **GENERATION_PARAMS,
                 "response_format": { "type": "text" },
                 "messages": [
                     {
@@ -35,34 +51,53 @@ def send_request(system_instruction, command, api_key, model):
                     },
                     {
                         "role": "user",
-                        "content": command
+                        # The context shared by the calls of a run right after the static instructions, for prefix caching
+                        "content": f"{context}\n{command}" if context else command
                     }
                 ]
             }
 
-            response = requests.post(
+            if stream_file:
+                payload["stream"] = True
+                payload["stream_options"] = { "include_usage": True }
+
+            start_time = time.monotonic()
+            response = client.post(
                 endpoint,
                 headers=headers,
                 json=payload,
-                timeout=300  # 5 minutes
+                stream=stream_file is not None,
+                timeout=policy.timeout(300)  # 5 minutes at most
             )
 
             response.raise_for_status()
-            response_data = response.json()
+
+            if stream_file:
+                message, usage = client.stream_text(response, stream_file, parse_stream_event, start_time, cancel_event)
+                response_data = build_streamed_response(message, usage)
+            else:
+                response_data = response.json()
 
             try:
                 message = response_data['choices'][0]['message']['content']
                 input_tokens = response_data['usage']['prompt_tokens']
-                cached_tokens = response_data['usage']['prompt_tokens_details']['cached_tokens']
+                cached_tokens = (response_data['usage'].get('prompt_tokens_details') or {}).get('cached_tokens') or 0
                 output_tokens = response_data['usage']['completion_tokens']
 
                 if message:
                     log(f"Model: {model}", "info")
                     log(f"Input tokens: {input_tokens}", "info")
                     log(f"Cached tokens: {cached_tokens}", "info")
+                    log(f"Cache hit ratio: {client.cache_hit_ratio(cached_tokens, input_tokens):.0%}", "info")
                     log(f"Output tokens: {output_tokens}", "info")
                     log(f"\n{message}")
 
+                    telemetry.record("github_models", model, policy.attempt, time.monotonic() - call_start_time, {
+                        "input_tokens": input_tokens,
+                        "cached_tokens": cached_tokens,
+                        "output_tokens": output_tokens
+                    })
+
                     return {
                         "error": False,
                         "message": message
@@ -73,22 +108,33 @@ def send_request(system_instruction, command, api_key, model):
                 log(f"Failed to parse API response: {e}", "error")
                 log(f"Response content: {json.dumps(response_data, indent=2)}", "error")
 
+        except client.StreamError as e:
+            log(f"Stream interrupted after {len(e.partial_message)} characters: {e}", "error")
+            if len(e.partial_message) > len(partial_message):
+                partial_message = e.partial_message
+
         except requests.exceptions.RequestException as e:
             log(f"Request failed: {e}", "error")
-            if hasattr(e, 'response') and e.response:
+            if e.response is not None:
                 try:
                     error_details = e.response.json()
                     log(f"{json.dumps(error_details, indent=2)}", "error")
-                except:
+                except ValueError:
                     log(f"{e.response.text}", "error")
+            policy.record_failure(e.response)
 
-        retry_count += 1
-        if retry_count < max_retries:
-            log(f"Waiting {wait_time} seconds before retry...", "info")
-            time.sleep(wait_time)
-
-    log(f"Failed to get valid response after {max_retries} retries.", "error")
+    if policy.is_cancelled():
+        log(f"Request to {model} was cancelled.", "info")
+    else:
+        log(f"Failed to get valid response after {policy.attempt} attempt(s).", "error")
+    telemetry.record("github_models", model, policy.attempt, time.monotonic() - call_start_time, error=True, partial=bool(partial_message))
+    if partial_message:
+        return { "error": True, "partial": True, "message": partial_message }
     return { "error": True }
 
-def generate_text(model, system_instruction, command, api_key):
-    return send_request(system_instruction, command, api_key, model)
\ No newline at end of file
+def generate_text(model, system_instruction, command, api_key, stream_file=None, cancel_event=None, context=None):
+    return cache.cached(
+        "github_models", model, system_instruction, command, GENERATION_PARAMS,
+        lambda: send_request(system_instruction, command, api_key, model, stream_file, cancel_event, context),
+        context
+    )
\ No newline at end of file
@@ -0,0 +1,79 @@
+import queue
+import threading
+import time
+
+from helpers import log
+
+DEFAULT_HEDGE_DELAY = 90  # Seconds, roughly the p95 latency of a changelog or code review request
+
+# Run generate(provider, cancel_event) with the first provider and start the next provider
+# whenever no response arrived within the hedge delay or the previous one failed.
+# The first successful response wins and the other requests are cancelled.
+def generate_text(provider_list, generate, hedge_delay=DEFAULT_HEDGE_DELAY):
+    if len(provider_list) == 1:
+        return generate(provider_list[0], None)
+
+    results = queue.Queue()
+    cancel_events = {}
+    start_times = {}
+    latencies = {}
+
+    def run(provider):
+        try:
+            response = generate(provider, cancel_events[provider])
+        except Exception as e:
+            log(f"Request to {provider} raised an exception: {e}", "error")
+            response = { "error": True }
+        results.put((provider, response, time.monotonic() - start_times[provider]))
+
+    def launch(provider):
+        log(f"Starting request with {provider}...", "info")
+        cancel_events[provider] = threading.Event()
+        start_times[provider] = time.monotonic()
+        # Daemon threads, so a cancelled request that is still waiting for the provider does not keep the process alive.
+        # generate has to hold to that too, diff_chunker.generate_all runs the chunk requests in daemon threads
+        # and stops waiting for them once the cancel event is set.
+        threading.Thread(target=run, args=(provider,), daemon=True).start()
+
+    waiting = list(provider_list)
+    launch(waiting.pop(0))
+    winner = None
+    best_partial = None
+
+    while len(latencies) < len(start_times):
+        try:
+            provider, response, elapsed = results.get(timeout=hedge_delay if waiting else None)
+        except queue.Empty:
+            log(f"No response after {hedge_delay}s, hedging with {waiting[0]}.", "warning")
+            launch(waiting.pop(0))
+            continue
+
+        latencies[provider] = elapsed
+        if response["error"] is False:
+            winner = (provider, response)
+            break
+
+        log(f"{provider} failed after {elapsed:.1f}s.", "warning")
+        if response.get("partial") and (best_partial is None or len(response["message"]) > len(best_partial["message"])):
+            best_partial = response
+        if waiting:
+            launch(waiting.pop(0))
+
+    for provider, cancel_event in cancel_events.items():
+        if provider not in latencies:
+            cancel_event.set()
+            log(f"Cancelled {provider} after {time.monotonic() - start_times[provider]:.1f}s.", "info")
+
+    for provider, elapsed in latencies.items():
+        log(f"Latency of {provider}: {elapsed:.1f}s", "info")
+
+    if winner is None:
+        log("All providers failed.", "error")
+        response = best_partial or { "error": True }
+        response["latencies"] = latencies
+        return response
+
+    provider, response = winner
+    log(f"Response from {provider} won.", "info")
+    response = dict(response, provider=provider, latencies=latencies)
+    return response
@@ -0,0 +1,25 @@
+import os
+
+from ai import openai, anthropic, gemini, github_models
+
+# Provider module and the environment variable holding its API key
+PROVIDERS = {
+    "openai": (openai, "OPENAI_API_KEY"),
+    "anthropic": (anthropic, "ANTHROPIC_API_KEY"),
+    "gemini": (gemini, "GEMINI_API_KEY"),
+    "github_models": (github_models, "GITHUB_MODELS_API_KEY")
+}
+
+def is_supported(provider):
+    return provider in PROVIDERS
+
+# Parse a comma separated list of providers, e.g. "openai,anthropic", dropping duplicates
+def parse_list(value):
+    return list(dict.fromkeys(provider.strip() for provider in value.split(",") if provider.strip()))
+
+# The context is text shared by several calls of a run, it is sent between the system instruction and the command
+# so the providers can cache it with the instructions
+def generate_text(provider, model, system_instruction, command, stream_file=None, cancel_event=None, context=None):
+    module, api_key_name = PROVIDERS[provider]
+    api_key = os.environ.get(api_key_name)
+    return module.generate_text(model, system_instruction, command, api_key, stream_file, cancel_event, context)
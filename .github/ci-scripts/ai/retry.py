@@ -0,0 +1,138 @@
+import random
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from helpers import log
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 2  # Seconds
+DEFAULT_MAX_DELAY = 60  # Seconds
+DEFAULT_DEADLINE = 900  # Seconds, overall budget for all attempts of a single request
+
+# Rate limits, overloaded providers and transient server errors are worth retrying,
+# other client errors (bad request, invalid key, unknown model) will fail the same way again
+RETRYABLE_STATUS_CODES = { 408, 409, 425, 429, 500, 502, 503, 504, 529 }
+
+# Headers telling when a rate limit resets, in order of preference
+RATE_LIMIT_RESET_HEADERS = [
+    "anthropic-ratelimit-requests-reset",
+    "anthropic-ratelimit-tokens-reset",
+    "x-ratelimit-reset-requests",
+    "x-ratelimit-reset-tokens"
+]
+
+def is_retryable_status(status_code):
+    return status_code in RETRYABLE_STATUS_CODES
+
+# Parse durations like "20ms", "1s" or "6m0s" as used by the OpenAI rate limit headers
+def parse_duration(value):
+    matches = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not matches or "".join(number + unit for number, unit in matches) != value:
+        return None
+
+    multipliers = { "ms": 0.001, "s": 1, "m": 60, "h": 3600 }
+    return sum(float(number) * multipliers[unit] for number, unit in matches)
+
+# Parse a reset header value that is either seconds, a duration, an RFC 3339 timestamp or an HTTP date
+def parse_reset_value(value):
+    value = value.strip()
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    duration = parse_duration(value)
+    if duration is not None:
+        return duration
+
+    try:
+        reset_time = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            reset_time = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+    if reset_time.tzinfo is None:
+        reset_time = reset_time.replace(tzinfo=timezone.utc)
+    return max((reset_time - datetime.now(timezone.utc)).total_seconds(), 0)
+
+# Number of seconds the provider asked us to wait, if it said so
+def get_retry_after(response):
+    if response is None:
+        return None
+
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        return parse_reset_value(retry_after)
+
+    if response.status_code == 429:
+        for header in RATE_LIMIT_RESET_HEADERS:
+            if response.headers.get(header):
+                return parse_reset_value(response.headers[header])
+
+    return None
+
+class RetryPolicy:
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, deadline=DEFAULT_DEADLINE, cancel_event=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_time = time.monotonic() + deadline
+        self.attempt = 0
+        self.last_response = None
+        self.give_up = False
+        self.cancel_event = cancel_event
+
+    def is_cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def remaining(self):
+        return self.deadline_time - time.monotonic()
+
+    # Request timeout that does not run past the deadline
+    def timeout(self, request_timeout):
+        return max(min(request_timeout, self.remaining()), 1)
+
+    # Remember why the attempt failed, responses with a non-retryable status stop the retries
+    def record_failure(self, response=None):
+        self.last_response = response
+        if response is not None and not is_retryable_status(response.status_code):
+            log(f"Status {response.status_code} is not retryable, giving up.", "error")
+            self.give_up = True
+
+    def get_delay(self):
+        retry_after = get_retry_after(self.last_response)
+        if retry_after is not None:
+            return retry_after
+
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (self.attempt - 1)))
+
+    # Wait before the next attempt, returns False when there are no attempts left or the request was cancelled
+    def next_attempt(self):
+        if self.is_cancelled():
+            return False
+
+        if self.attempt > 0:
+            if self.give_up or self.attempt >= self.max_attempts:
+                return False
+
+            delay = self.get_delay()
+            if delay >= self.remaining():
+                log(f"Waiting {delay:.1f} seconds would exceed the deadline, giving up.", "error")
+                return False
+
+            log(f"Waiting {delay:.1f} seconds before retry...", "info")
+            if self.cancel_event is not None:
+                if self.cancel_event.wait(delay):
+                    return False
+            else:
+                time.sleep(delay)
+            self.last_response = None
+
+        self.attempt += 1
+        return True
@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import time
+
+from ai import client
+
+DEFAULT_METRICS_DIR = os.path.join(".github", "ai-metrics")
+
+# USD per million tokens: uncached input, cache reads, cache writes and output
+PRICES = {
+    "gpt-4.1": { "input": 2.00, "cached": 0.50, "cache_write": 2.00, "output": 8.00 },
+    "gpt-4.1-mini": { "input": 0.40, "cached": 0.10, "cache_write": 0.40, "output": 1.60 },
+    "claude-sonnet-4-20250514": { "input": 3.00, "cached": 0.30, "cache_write": 3.75, "output": 15.00 },
+    "gemini-2.5-pro-preview-06-05": { "input": 1.25, "cached": 0.31, "cache_write": 1.25, "output": 10.00 },
+    # GitHub Models are billed through the GitHub plan, not per token
+    "openai/gpt-4.1": { "input": 0, "cached": 0, "cache_write": 0, "output": 0 },
+    "openai/gpt-4.1-mini": { "input": 0, "cached": 0, "cache_write": 0, "output": 0 }
+}
+
+_config = {
+    "metrics_file": None
+}
+_lock = threading.Lock()
+
+# One metrics file per workflow run, so runs never write to the same file
+def default_metrics_file():
+    run_id = os.environ.get("GITHUB_RUN_ID", "local")
+    run_attempt = os.environ.get("GITHUB_RUN_ATTEMPT", "1")
+    return os.path.join(DEFAULT_METRICS_DIR, f"{run_id}-{run_attempt}.jsonl")
+
+# Set the file the records are appended to, None disables the telemetry
+def configure(metrics_file=None):
+    _config["metrics_file"] = metrics_file
+
+# Estimated cost in USD, None for models without a known price
+def estimate_cost(model, input_tokens, cached_tokens=0, cache_write_tokens=0, output_tokens=0):
+    prices = PRICES.get(model)
+    if prices is None:
+        return None
+
+    uncached_tokens = input_tokens - cached_tokens - cache_write_tokens
+    cost = (
+        uncached_tokens * prices["input"]
+        + cached_tokens * prices["cached"]
+        + cache_write_tokens * prices["cache_write"]
+        + output_tokens * prices["output"]
+    ) / 1_000_000
+    return round(cost, 6)
+
+# Append a JSON line describing a single generate_text call.
+# The timings come from the last request made by the calling thread, so call it from the thread that made the request.
+def record(provider, model, attempts=0, duration=None, usage=None, error=False, partial=False, cache_hit=False):
+    if _config["metrics_file"] is None:
+        return
+
+    usage = usage or {}
+    input_tokens = usage.get("input_tokens", 0)
+    cached_tokens = usage.get("cached_tokens", 0)
+    cache_write_tokens = usage.get("cache_write_tokens", 0)
+    output_tokens = usage.get("output_tokens", 0)
+    timings = client.get_timings() if attempts else {}
+
+    entry = {
+        "timestamp": time.time(),
+        "run_id": os.environ.get("GITHUB_RUN_ID"),
+        "provider": provider,
+        "model": model,
+        "attempts": attempts,
+        "error": error,
+        "partial": partial,
+        "cache_hit": cache_hit,
+        "connect": timings.get("connect"),
+        "tls": timings.get("tls"),
+        "ttfb": timings.get("ttfb"),
+        "ttft": timings.get("ttft"),
+        "total": duration,
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "cache_write_tokens": cache_write_tokens,
+        "output_tokens": output_tokens,
+        "cost": 0 if cache_hit else estimate_cost(model, input_tokens, cached_tokens, cache_write_tokens, output_tokens)
+    }
+
+    line = json.dumps(entry) + "\n"
+    with _lock:
+        directory = os.path.dirname(_config["metrics_file"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(_config["metrics_file"], "a", encoding="utf-8") as f:
+            f.write(line)
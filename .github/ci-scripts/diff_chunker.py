@@ -0,0 +1,218 @@
+import queue
+import re
+import threading
+
+from ai import providers
+from helpers import log
+
+# Approximate number of diff tokens sent in a single prompt, leaving room for the instructions and the response
+TOKEN_BUDGETS = {
+    "gpt-4.1": 120000,
+    "gpt-4.1-mini": 120000,
+    "claude-sonnet-4-20250514": 100000,
+    "gemini-2.5-pro-preview-06-05": 200000,
+    "openai/gpt-4.1": 6000,
+    "openai/gpt-4.1-mini": 6000
+}
+DEFAULT_TOKEN_BUDGET = 50000
+DEFAULT_MAX_WORKERS = 4
+CANCEL_POLL_INTERVAL = 0.5  # Seconds between checks of the cancel event while waiting for chunk responses
+MIN_DIFF_BUDGET = 1000  # Diff tokens per prompt when the instructions alone nearly fill the budget
+
+CHUNKING_MODES = ["auto", "always", "never"]
+
+# Rough estimate, most tokenizers average about 4 characters per token for code
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+def get_token_budget(model):
+    return TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+def payload_tokens(request_payload):
+    return sum(estimate_tokens(request_payload.get(part) or "") for part in ["system_instruction", "context", "command"])
+
+# Send a payload, its optional context is the part shared with the other payloads of the run
+def generate_payload(provider, model, request_payload, stream_file=None, cancel_event=None):
+    return providers.generate_text(
+        provider, model, request_payload["system_instruction"], request_payload["command"], stream_file, cancel_event, request_payload.get("context")
+    )
+
+# The instructions and commit info are sent with every prompt, only the rest of the budget is left for the diff or summaries
+def remaining_budget(budget, fixed_payload):
+    remaining = budget - payload_tokens(fixed_payload)
+    if remaining < MIN_DIFF_BUDGET:
+        log(f"The prompt without the diff already has ~{budget - remaining} of {budget} tokens, using ~{MIN_DIFF_BUDGET} tokens for the diff.", "warning")
+        return MIN_DIFF_BUDGET
+    return remaining
+
+# Group texts in order so that each group fits the token budget
+def pack(texts, budget):
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        text_tokens = estimate_tokens(text)
+        if current and current_tokens + text_tokens > budget:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += text_tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def split_on(text, pattern):
+    parts = []
+    current = []
+    for line in text.splitlines(keepends=True):
+        if re.match(pattern, line) and current:
+            parts.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        parts.append("".join(current))
+    return parts
+
+def split_lines(text, budget):
+    return ["".join(group) for group in pack(text.splitlines(keepends=True), budget)]
+
+# Split a file diff that does not fit the budget into hunks, repeating the file header in front of each piece
+def split_file_diff(file_diff, budget):
+    sections = split_on(file_diff, r"@@ ")
+    header = sections[0] if not sections[0].startswith("@@ ") else ""
+    hunks = sections[1:] if header else sections
+    hunk_budget = max(budget - estimate_tokens(header), 1)
+
+    pieces = []
+    for hunk in hunks:
+        if estimate_tokens(hunk) <= hunk_budget:
+            pieces.append(header + hunk)
+        else:
+            pieces.extend(header + part for part in split_lines(hunk, hunk_budget))
+
+    return pieces or [file_diff]
+
+# Split the diff of one commit on file and hunk boundaries, returning its header and the pieces that fit next to it
+def split_commit_diff(commit_diff, budget):
+    sections = split_on(commit_diff, r"diff --git ")
+    header = sections[0] if not sections[0].startswith("diff --git ") else ""
+    file_diffs = sections[1:] if header else sections
+    file_budget = max(budget - estimate_tokens(header), 1)
+
+    pieces = []
+    for file_diff in file_diffs:
+        if estimate_tokens(file_diff) <= file_budget:
+            pieces.append(file_diff)
+        else:
+            pieces.extend(split_file_diff(file_diff, file_budget))
+
+    return header, pieces or [""]
+
+# Split a diff on commit, file and hunk boundaries into chunks that each fit the token budget,
+# repeating the commit header in front of each chunk that starts in the middle of a commit
+def chunk_diff(diff, budget):
+    chunks = []
+    current = []
+    current_tokens = 0
+    for commit_diff in split_on(diff, r"# Commit "):
+        header, pieces = split_commit_diff(commit_diff, budget)
+        for i, piece in enumerate(pieces):
+            text = header + piece if i == 0 else piece
+            if current and current_tokens + estimate_tokens(text) > budget:
+                chunks.append("".join(current))
+                current = []
+                current_tokens = 0
+            if not current:
+                text = header + piece
+            current.append(text)
+            current_tokens += estimate_tokens(text)
+    if current:
+        chunks.append("".join(current))
+
+    return chunks
+
+def is_cancelled(cancel_event):
+    return cancel_event is not None and cancel_event.is_set()
+
+# Generate the responses of several payloads in parallel, at most max_workers at a time, in the order of the payloads.
+# The requests run in daemon threads and are not waited for once the cancel event is set,
+# so a cancelled request that is still waiting for the provider does not keep the process alive.
+def generate_all(provider, model, request_payloads, max_workers, cancel_event=None):
+    pending = queue.Queue()
+    for index, request_payload in enumerate(request_payloads):
+        pending.put((index, request_payload))
+    results = queue.Queue()
+
+    def work():
+        while not is_cancelled(cancel_event):
+            try:
+                index, request_payload = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                response = generate_payload(provider, model, request_payload, None, cancel_event)
+            except Exception as e:
+                log(f"Request {index + 1} to {provider} raised an exception: {e}", "error")
+                response = { "error": True }
+            results.put((index, response))
+
+    for _ in range(min(max_workers, len(request_payloads))):
+        threading.Thread(target=work, daemon=True).start()
+
+    responses = [{ "error": True }] * len(request_payloads)
+    received = 0
+    while received < len(request_payloads):
+        try:
+            index, response = results.get(timeout=CANCEL_POLL_INTERVAL)
+        except queue.Empty:
+            if is_cancelled(cancel_event):
+                break
+            continue
+        responses[index] = response
+        received += 1
+    return responses
+
+def reduce_summaries(provider, model, summaries, create_reduce_payload, budget, max_workers, stream_file=None, cancel_event=None):
+    budget = remaining_budget(budget, create_reduce_payload([]))
+
+    # Merge groups of summaries first if all of them together do not fit in one prompt
+    while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > budget:
+        groups = pack(summaries, budget)
+        if len(groups) == len(summaries):
+            break
+        log(f"Merging {len(summaries)} summaries in {len(groups)} groups...", "info")
+        responses = generate_all(provider, model, [create_reduce_payload(group) for group in groups], max_workers, cancel_event)
+        if is_cancelled(cancel_event) or any(response["error"] is True for response in responses):
+            return { "error": True }
+        summaries = [response["message"] for response in responses]
+
+    request_payload = create_reduce_payload(summaries)
+    return generate_payload(provider, model, request_payload, stream_file, cancel_event)
+
+# Generate text for a diff, summarising chunks in parallel (map) and merging them (reduce) when the diff is too large.
+# Only the final response is streamed to the stream file.
+def generate_text(provider, model, diff, create_payload, create_chunk_payload, create_reduce_payload,
+                  chunking="auto", max_chunk_tokens=None, max_workers=DEFAULT_MAX_WORKERS, stream_file=None, cancel_event=None):
+    budget = max_chunk_tokens or get_token_budget(model)
+    diff_tokens = estimate_tokens(diff)
+
+    if chunking == "never" or (chunking == "auto" and diff_tokens <= remaining_budget(budget, create_payload(""))):
+        request_payload = create_payload(diff)
+        return generate_payload(provider, model, request_payload, stream_file, cancel_event)
+
+    chunk_budget = remaining_budget(budget, create_chunk_payload(""))
+    chunks = chunk_diff(diff, chunk_budget)
+    log(f"Diff has ~{diff_tokens} tokens, split into {len(chunks)} chunks of at most ~{chunk_budget} diff tokens.", "info")
+
+    responses = generate_all(provider, model, [create_chunk_payload(chunk) for chunk in chunks], max_workers, cancel_event)
+    if is_cancelled(cancel_event):
+        return { "error": True }
+    failed = [index for index, response in enumerate(responses) if response["error"] is True]
+    if failed:
+        log(f"Failed to summarise chunks: {', '.join(str(index + 1) for index in failed)}", "error")
+        return { "error": True }
+
+    log(f"Summarised {len(chunks)} chunks, merging summaries...", "info")
+    summaries = [response["message"] for response in responses]
+    return reduce_summaries(provider, model, summaries, create_reduce_payload, budget, max_workers, stream_file, cancel_event)
@@ -0,0 +1,60 @@
+import fnmatch
+import os
+
+from helpers import log
+
+# Files that cost prompt tokens without telling the model anything about the change.
+# Patterns without a slash match the file name in any directory, patterns with a slash the whole path.
+DEFAULT_EXCLUDES = [
+    # Lockfiles
+    "pubspec.lock",
+    "Podfile.lock",
+    "package-lock.json",
+    "yarn.lock",
+    # Generated code
+    "*.g.dart",
+    "*.freezed.dart",
+    "*.mocks.dart",
+    "*.gr.dart",
+    "GeneratedPluginRegistrant.*",
+    "generated_plugin_registrant.*",
+    "generated_plugins.cmake",
+    "*.pbxproj",
+    # Images and fonts
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.webp",
+    "*.ico",
+    "*.ttf",
+    "*.otf",
+    "*/Assets.xcassets/*/Contents.json"
+]
+
+DEFAULT_MAX_FILE_LINES = 2000  # Changed lines above which a file is only summarised
+
+def is_excluded(path, patterns):
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(path if "/" in pattern else name, pattern) for pattern in patterns)
+
+# Why a changed file is left out of the diff, None if it is kept.
+# The stat holds the path and the added and deleted lines, which are None for binary files.
+def filter_reason(stat, excludes, max_file_lines):
+    if is_excluded(stat["path"], excludes):
+        return "excluded"
+    if stat["added"] is None:
+        return "binary"
+    if max_file_lines and stat["added"] + stat["deleted"] > max_file_lines:
+        return f"more than {max_file_lines} changed lines"
+    return None
+
+def log_savings(filtered, saved_bytes):
+    if not filtered:
+        log("No files were left out of the diff.", "info")
+        return
+
+    # Same estimate of 4 bytes per token as the diff chunker
+    log(f"Left {len(filtered)} files out of the diff, saving {saved_bytes} bytes (~{saved_bytes // 4} tokens).", "info")
+    for stat in filtered:
+        log(f"  {stat['path']} ({stat['filtered']})", "info")
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import random
+import re
+from datetime import datetime, timezone
+
+import log_compressor
+import log_triage
+from helpers import log
+
+DEFAULT_INDEX_FILE = os.path.join(".github", ".build-state", "failure-index.json")
+DEFAULT_SIMILARITY = 0.8  # Estimated Jaccard similarity above which a stored analysis is reused
+DEFAULT_MAX_ENTRIES = 500
+MAX_ERROR_LINES = 200
+CAUSE_LINES = 10  # Lines after an error line that explain it, up to the next blank line
+
+# Bumped when fingerprints are computed differently, entries of other versions can not be compared
+INDEX_VERSION = 2
+
+# Error lines that only say that something failed, not why. Every failed build of a tool has them,
+# so they are left out of the fingerprint. Headers introduce the cause in the lines after them,
+# summaries end the output of a failure.
+HEADER_PATTERNS = [
+    r"^FAILURE: Build failed with an exception",
+    r"^\* What went wrong:",
+    r"^Traceback \(most recent call last\)",
+]
+SUMMARY_PATTERNS = [
+    # Gradle
+    r"^BUILD FAILED",
+    r"^\* Try:",
+    # Flutter
+    r"Gradle task \S+ failed with exit code",
+    # Xcode
+    r"\*\* BUILD FAILED \*\*",
+    # Non-zero exits
+    r"exit(ed with)? (code|value) [1-9]\d*\.?\s*$",
+    r"returned non-zero exit status \d+\.?\s*$",
+]
+HEADER_PATTERN = re.compile("|".join(f"(?:{pattern})" for pattern in HEADER_PATTERNS))
+SUMMARY_PATTERN = re.compile("|".join(f"(?:{pattern})" for pattern in SUMMARY_PATTERNS))
+
+# Markers log_triage puts where it left out lines
+OMITTED_PATTERN = re.compile(r"^\[\.\.\. \d+ lines omitted \.\.\.\]$")
+
+# Directories change between runners and checkouts, only the file name identifies a file
+PATH_PATTERN = re.compile(r"(?:[A-Za-z]:)?(?:[\w.@~+-]*[/\\])+([\w.@+-]+)")
+REPEAT_MARKER_PATTERN = re.compile(r" \(×\d+\)$|^\(previous \d+ lines ×\d+\)$")
+
+# MinHash with a fixed set of hash functions, signatures have to be comparable between runs
+MINHASH_SIZE = 64
+MINHASH_PRIME = (1 << 61) - 1
+_random = random.Random(2024)
+MINHASH_PARAMS = [(_random.randrange(1, MINHASH_PRIME), _random.randrange(0, MINHASH_PRIME)) for _ in range(MINHASH_SIZE)]
+SHINGLE_SIZE = 3  # Words
+
+# Mask the parts of a line that differ between occurrences of the same error
+def mask(line):
+    line = REPEAT_MARKER_PATTERN.sub("", log_compressor.clean(line))
+    return log_compressor.normalize(PATH_PATTERN.sub(r"\1", line)).strip()
+
+# The lines that explain the errors of some logs, masked: the specific error lines and the lines after
+# each error line up to the next blank line, like the cause that Gradle prints after "What went wrong:".
+# Empty if the logs only show that something failed.
+def error_lines(logs):
+    lines = []
+    remaining = 0
+    for line in logs.splitlines():
+        line = log_compressor.clean(line)
+        if SUMMARY_PATTERN.search(line):
+            remaining = 0
+            continue
+        if log_triage.is_error(line):
+            remaining = CAUSE_LINES
+            if HEADER_PATTERN.search(line):
+                continue
+        elif not line.strip() or OMITTED_PATTERN.match(line):
+            remaining = 0
+            continue
+        elif remaining:
+            remaining -= 1
+        else:
+            continue
+
+        line = mask(line)
+        if line and line not in lines:
+            lines.append(line)
+            if len(lines) == MAX_ERROR_LINES:
+                break
+    return lines
+
+def shingles(lines):
+    words = " ".join(lines).split()
+    if len(words) <= SHINGLE_SIZE:
+        return { " ".join(words) }
+    return { " ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1) }
+
+def minhash(lines):
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big") for shingle in shingles(lines)]
+    return [min((a * h + b) % MINHASH_PRIME for h in hashes) for a, b in MINHASH_PARAMS]
+
+def similarity(signature, other):
+    return sum(1 for x, y in zip(signature, other) if x == y) / MINHASH_SIZE
+
+# Fingerprint and MinHash signature of masked error lines, None if there are none
+def fingerprint_lines(lines):
+    if not lines:
+        return None
+    return {
+        "hash": hashlib.sha256("\n".join(sorted(lines)).encode("utf-8")).hexdigest(),
+        "minhash": minhash(lines),
+        "error_lines": lines
+    }
+
+# Fingerprint of the errors in some logs, None if the logs show no errors or only generic ones
+def fingerprint(logs):
+    return fingerprint_lines(error_lines(logs))
+
+# Past error analyses by the fingerprint of the errors they explained
+class FailureIndex:
+    def __init__(self, path=DEFAULT_INDEX_FILE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+
+        self.entries = data.get("entries", [])
+        if self.entries and data.get("version") != INDEX_VERSION:
+            log(f"Dropping {len(self.entries)} failure signatures of an older index version.", "info")
+            self.entries = []
+
+    # The stored entry closest to the fingerprint and its estimated similarity, None if none is similar enough.
+    # The index is small enough to compare against every entry.
+    def find(self, fingerprint, threshold=DEFAULT_SIMILARITY):
+        best, best_similarity = None, 0
+        for entry in self.entries:
+            if entry["hash"] == fingerprint["hash"]:
+                best, best_similarity = entry, 1.0
+                break
+            entry_similarity = similarity(fingerprint["minhash"], entry["minhash"])
+            if entry_similarity > best_similarity:
+                best, best_similarity = entry, entry_similarity
+
+        if best is None or best_similarity < threshold:
+            return None
+
+        best["hits"] = best.get("hits", 0) + 1
+        best["last_hit_at"] = datetime.now(timezone.utc).isoformat()
+        return best, best_similarity
+
+    def add(self, fingerprint, analysis, run_id=None):
+        now = datetime.now(timezone.utc).isoformat()
+        self.entries = [entry for entry in self.entries if entry["hash"] != fingerprint["hash"]]
+        self.entries.append({
+            "hash": fingerprint["hash"],
+            "minhash": fingerprint["minhash"],
+            "error_lines": fingerprint["error_lines"][:20],
+            "analysis": analysis,
+            "run_id": run_id,
+            "created_at": now,
+            "last_hit_at": now,
+            "hits": 0
+        })
+
+        # Forget the analyses that were not needed for the longest time
+        if len(self.entries) > self.max_entries:
+            self.entries.sort(key=lambda entry: entry["last_hit_at"])
+            self.entries = self.entries[-self.max_entries:]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({ "version": INDEX_VERSION, "entries": self.entries }, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        log(f"Saved {len(self.entries)} failure signatures to {self.path}", "info")
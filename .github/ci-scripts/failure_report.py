@@ -0,0 +1,182 @@
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+import failure_index
+from helpers import log
+
+# Fingerprints of the failure pages ingested so far, pages never change once written
+DEFAULT_INDEX_FILE = os.path.join(".github", ".build-state", "failure-report.json")
+DEFAULT_TOP = 10
+MAX_LINES_PER_FAILURE = 50
+
+PAGE_NAME_PATTERN = re.compile(r"^Failure-(\d{8})-(\w+)\.md$")
+DATE_PATTERN = re.compile(r"^\*\*Date:\*\* (.+?)\s*$", re.MULTILINE)
+RUN_PATTERN = re.compile(r"/actions/runs/(\d+)")
+CODE_BLOCK_PATTERN = re.compile(r"```[^\n]*\n(.*?)```", re.DOTALL)
+
+# Failure pages and error analysis files of the given paths, directories are searched for Failure-*.md files
+def find_sources(paths):
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(sorted(glob.glob(os.path.join(path, "Failure-*.md"))))
+        elif os.path.exists(path):
+            sources.append(path)
+        else:
+            log(f"Skipping {path}, it does not exist.", "warning")
+    return sources
+
+def parse_date(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d %H:%M:%S %z").astimezone(timezone.utc)
+    except ValueError:
+        return None
+
+# The error messages of an analysis are in its code blocks, the whole analysis is used if it has none
+def analysis_lines(analysis):
+    blocks = CODE_BLOCK_PATTERN.findall(analysis)
+    lines = []
+    for line in "\n".join(blocks or [analysis]).splitlines():
+        line = failure_index.mask(line)
+        if line and line not in lines:
+            lines.append(line)
+            if len(lines) == MAX_LINES_PER_FAILURE:
+                break
+    return lines
+
+def read_source(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        content = f.read()
+
+    name_match = PAGE_NAME_PATTERN.match(os.path.basename(path))
+    if path.endswith(".json"):
+        # An error_analysis.json, it only knows the analysis
+        analysis = json.loads(content).get("error_analysis", "")
+        date = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+        commit = None
+        run_id = None
+    else:
+        analysis = content.split("## 🚨 Error Analysis", 1)[-1].split("## 🔗 Links", 1)[0]
+        date_match = DATE_PATTERN.search(content)
+        date = parse_date(date_match.group(1)) if date_match else None
+        if not date and name_match:
+            date = datetime.strptime(name_match.group(1), "%Y%m%d").replace(tzinfo=timezone.utc)
+        commit = name_match.group(2) if name_match else None
+        run_match = RUN_PATTERN.search(content)
+        run_id = run_match.group(1) if run_match else None
+
+    fingerprint = failure_index.fingerprint_lines(analysis_lines(analysis))
+    return {
+        "date": date.isoformat() if date else None,
+        "commit": commit,
+        "run_id": run_id,
+        "hash": fingerprint["hash"] if fingerprint else None,
+        "minhash": fingerprint["minhash"] if fingerprint else None,
+        "summary": fingerprint["error_lines"][0] if fingerprint else None
+    }
+
+# Add the sources that are not in the index yet, returns the number of added sources
+def ingest(index, sources):
+    added = 0
+    for path in sources:
+        # Pages are named after their build, error analysis files are rewritten in place
+        key = os.path.basename(path) if PAGE_NAME_PATTERN.match(os.path.basename(path)) else os.path.abspath(path)
+        size = os.path.getsize(path)
+        if key in index and index[key]["size"] == size:
+            continue
+        try:
+            index[key] = dict(read_source(path), size=size)
+            added += 1
+        except (OSError, json.JSONDecodeError) as e:
+            log(f"Skipping {path}: {e}", "warning")
+    return added
+
+def read_index(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("failures", {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_index(path, index):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({ "failures": index }, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+# Group the failures in date order, each failure joins the first cluster whose first failure is similar enough
+def cluster(index, threshold):
+    failures = sorted(
+        (dict(failure, name=name) for name, failure in index.items() if failure["hash"] and failure["date"]),
+        key=lambda failure: failure["date"]
+    )
+
+    clusters = []
+    for failure in failures:
+        for group in clusters:
+            leader = group[0]
+            if leader["hash"] == failure["hash"] or failure_index.similarity(leader["minhash"], failure["minhash"]) >= threshold:
+                group.append(failure)
+                break
+        else:
+            clusters.append([failure])
+    return clusters
+
+def summarize(clusters):
+    rows = []
+    for group in clusters:
+        dates = [datetime.fromisoformat(failure["date"]) for failure in group]
+        gaps = [(later - earlier).total_seconds() / 86400 for earlier, later in zip(dates, dates[1:])]
+        rows.append({
+            "count": len(group),
+            "first_seen": group[0]["date"],
+            "last_seen": group[-1]["date"],
+            "mean_days_between": sum(gaps) / len(gaps) if gaps else None,
+            "summary": group[0]["summary"],
+            "latest": group[-1]["name"]
+        })
+    rows.sort(key=lambda row: (row["count"], row["last_seen"]), reverse=True)
+    return rows
+
+def print_report(rows, total):
+    header = f"{'Count':>6}  {'First seen':<11}{'Last seen':<11}{'Every':>9}  Error"
+    print(header)
+    print("-" * 100)
+    for row in rows:
+        every = "-" if row["mean_days_between"] is None else f"{row['mean_days_between']:.1f}d"
+        print(f"{row['count']:>6}  {row['first_seen'][:10]:<11}{row['last_seen'][:10]:<11}{every:>9}  {row['summary'][:60]}")
+        print(f"{'':>39}latest: {row['latest']}")
+    print("-" * 100)
+    print(f"{total} failures")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Cluster failed builds by their errors and report the most frequent ones')
+    p.add_argument('paths', nargs='*', default=['.'], help='Wiki checkouts, Failure-*.md pages or error_analysis.json files')
+    p.add_argument('--index-file', default=DEFAULT_INDEX_FILE, help='Index of the failures ingested so far')
+    p.add_argument('--similarity', type=float, default=failure_index.DEFAULT_SIMILARITY, help='Estimated similarity of the errors above which failures are clustered (0-1)')
+    p.add_argument('--top', type=int, default=DEFAULT_TOP, help='Number of clusters to report')
+    p.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = p.parse_args()
+
+    index = read_index(args.index_file)
+    added = ingest(index, find_sources(args.paths))
+    if added:
+        write_index(args.index_file, index)
+    log(f"Ingested {added} new failures, {len(index)} in total.", "info")
+
+    clusters = cluster(index, args.similarity)
+    if not clusters:
+        log("No failures found.", "warning")
+        sys.exit(0)
+
+    rows = summarize(clusters)[:args.top]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_report(rows, sum(len(group) for group in clusters))
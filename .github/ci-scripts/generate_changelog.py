@@ -3,21 +3,24 @@ import json
 import os
 import sys
 
-from ai import openai, anthropic, gemini, github_models
-from helpers import log, sanitize
+import diff_chunker
+from ai import cache, hedge, providers, telemetry
+from helpers import log, read_argument, sanitize
 
-def create_payload(commit_info, diff, repo):
-    system_instruction = f"""
-    You are an expert programmer that can analyze what kind of high-level changes have been made in a codebase and create a changelog.
-    You have access to the commits with their messages and changes (git diff log).
-    The target audience is a project manager that needs to know high-level changes in the project.
-    
-    Here are all the changed files with their diffs and associated commits (git diff log):
-    {commit_info}
-    {diff}
-    """
+MODELS = {
+    "openai": "gpt-4.1",
+    "anthropic": "claude-sonnet-4-20250514",
+    "gemini": "gemini-2.5-pro-preview-06-05",
+    "github_models": "openai/gpt-4.1-mini"
+}
 
-    command = f"""
+OUTPUT_FILE = "./.github/changelog.json"
+STREAM_FILE = "./.github/changelog.{provider}.partial.md"
+
+# Static instructions come first and the commits and diff last,
+# so the providers can cache the shared prompt prefix between runs
+def create_instructions(repo):
+    return f"""
     Please analyze the changes and create a changelog with a high-level description of the changes.
     Categorize the changes by the committer name.
     Then categorize the changes by using the folder structure, with '{repo}' as the root folder, for example '{repo}/lib', '{repo}/.github', etc. Do not include the file name in the category.
@@ -49,56 +52,162 @@ def create_payload(commit_info, diff, repo):
     Use GitHub markdown syntax in your response. Do not wrap the response in ```markdown.
     """
 
+# The commits are the same in every call of a run, they are sent as context right after the static instructions,
+# so the chunk calls share a prefix that is long enough for the providers to cache
+def create_context(commit_info):
+    return f"""
+    Here are the commits and changed files:
+    {commit_info}
+    """
+
+def create_payload(commit_info, diff, repo):
+    system_instruction = f"""
+    You are an expert programmer that can analyze what kind of high-level changes have been made in a codebase and create a changelog.
+    You have access to the commits with their messages and changes (git diff log).
+    The git diff log has one patch per commit in date order, oldest first, each starting with a '# Commit' line naming the commit.
+    Later commits supersede the changes of earlier ones, so describe the end result rather than the steps in between.
+    The target audience is a project manager that needs to know high-level changes in the project.
+    {create_instructions(repo)}
+    """
+
+    command = f"""
+    Here is the git diff log with one patch per commit in date order:
+    {diff}
+    """
+
+    payload = {
+        "system_instruction": system_instruction,
+        "context": create_context(commit_info),
+        "command": command
+    }
+
+    return payload
+
+def create_chunk_payload(commit_info, diff, repo):
+    system_instruction = f"""
+    You are an expert programmer that can analyze what kind of high-level changes have been made in a codebase.
+    You have access to the commits with their messages and one part of a larger git diff log.
+    The git diff log has one patch per commit in date order, oldest first, each starting with a '# Commit' line naming the commit.
+    Later commits supersede the changes of earlier ones, so describe the end result rather than the steps in between.
+    Your summary will be merged with the summaries of the other parts into a single changelog.
+
+    Please list the high-level changes made in this part of the diff log.
+    For each change, give the committer name, the folder with '{repo}' as the root folder, and whether it is a new feature, a bug fix, or a refactoring.
+    Keep each change description a single line and do not add an introduction or closing remarks.
+    """
+
+    command = f"""
+    Here is this part of the git diff log, with one patch per commit in date order:
+    {diff}
+    """
+
     payload = {
         "system_instruction": system_instruction,
+        "context": create_context(commit_info),
         "command": command
     }
 
     return payload
 
+def create_reduce_payload(commit_info, summaries, repo):
+    summarized_changes = "\n\n".join(summaries)
+    system_instruction = f"""
+    You are an expert programmer that can analyze what kind of high-level changes have been made in a codebase and create a changelog.
+    The git diff log was too large to analyze at once, so it was split into parts and the changes in each part were summarized.
+    The git diff log has one patch per commit in date order, so later parts hold later commits, which supersede the changes of earlier ones.
+    Describe the end result rather than the steps in between.
+    The target audience is a project manager that needs to know high-level changes in the project.
+    {create_instructions(repo)}
+    """
+
+    command = f"""
+    Here are the summarized changes of each part, in date order:
+    {summarized_changes}
+    """
+
+    payload = {
+        "system_instruction": system_instruction,
+        "context": create_context(commit_info),
+        "command": command
+    }
+
+    return payload
+
+def save_changelog(message, path=OUTPUT_FILE, partial=False):
+    payload = { "changelog": message }
+    if partial:
+        payload["partial"] = True
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+
+# Generate the changelog with the providers hedged in order of preference, chunking the diff when it is too large.
+# args holds the hedge delay, chunking, chunk token budget and stream options of the command line.
+def generate(provider_list, commit_info, diff, repo, args):
+    return hedge.generate_text(
+        provider_list,
+        lambda provider, cancel_event: diff_chunker.generate_text(
+            provider,
+            MODELS[provider],
+            diff,
+            lambda diff: create_payload(commit_info, diff, repo),
+            lambda chunk: create_chunk_payload(commit_info, chunk, repo),
+            lambda summaries: create_reduce_payload(commit_info, summaries, repo),
+            chunking=args.chunking,
+            max_chunk_tokens=args.max_chunk_tokens,
+            stream_file=STREAM_FILE.format(provider=provider) if args.stream else None,
+            cancel_event=cancel_event
+        ),
+        args.hedge_delay
+    )
+
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
-    p.add_argument('--commit-info', required=True)
-    p.add_argument('--diff', required=True)
-    p.add_argument('--provider', required=True)
+    commit_info_group = p.add_mutually_exclusive_group(required=True)
+    commit_info_group.add_argument('--commit-info')
+    commit_info_group.add_argument('--commit-info-file', help='Path of the commit information file, or - to read it from stdin')
+    diff_group = p.add_mutually_exclusive_group(required=True)
+    diff_group.add_argument('--diff')
+    diff_group.add_argument('--diff-file', help='Path of the diff file, or - to read it from stdin')
+    p.add_argument('--provider', required=True, help='Provider, or comma separated providers to hedge across in order of preference')
+    p.add_argument('--hedge-delay', type=float, default=hedge.DEFAULT_HEDGE_DELAY, help='Seconds to wait for a provider before also starting the next one')
+    p.add_argument('--no-cache', action='store_true', help='Always call the provider, bypassing the response cache')
+    p.add_argument('--cache-dir', default=cache.DEFAULT_CACHE_DIR, help='Directory of the response cache')
+    p.add_argument('--metrics-file', default=telemetry.default_metrics_file(), help='File the per-call metrics are appended to as JSON lines')
+    p.add_argument('--no-metrics', action='store_true', help='Do not record per-call metrics')
+    p.add_argument('--stream', action='store_true', help=f'Stream the response, writing it to {STREAM_FILE} as it arrives')
+    p.add_argument('--chunking', choices=diff_chunker.CHUNKING_MODES, default='auto', help='Split the diff into chunks that are summarised in parallel and merged')
+    p.add_argument('--max-chunk-tokens', type=int, help='Token budget of a single chunk (default depends on the model)')
     args = p.parse_args()
 
+    cache.configure(enabled=not args.no_cache, cache_dir=args.cache_dir)
+    telemetry.configure(None if args.no_metrics else args.metrics_file)
+
     repo = os.environ.get("GITHUB_REPOSITORY").split("/")[0]
     branch = os.environ.get("GITHUB_REF_NAME")
 
-    log("Creating payload for changelog generation...", "info") 
-    request_payload = create_payload(sanitize(args.commit_info), sanitize(args.diff), repo)
-    log("Completed creating payload for changelog generation.", "info")
+    provider_list = providers.parse_list(args.provider)
+    for provider in provider_list:
+        if not providers.is_supported(provider):
+            log(f"Provider '{provider}' is currently not supported.", "error")
+            sys.exit(1)
+
+    commit_info = sanitize(read_argument(args.commit_info, args.commit_info_file))
+    diff = sanitize(read_argument(args.diff, args.diff_file))
 
     log("Generating changelog...", "info")
 
-    response = None
-    if args.provider == "openai":
-        api_key = os.environ.get("OPENAI_API_KEY")
-        response = openai.generate_text("gpt-4.1", request_payload["system_instruction"], request_payload["command"], api_key)
-    elif args.provider == "anthropic":
-        api_key = os.environ.get("ANTHROPIC_API_KEY")
-        response = anthropic.generate_text("claude-sonnet-4-20250514", request_payload["system_instruction"], request_payload["command"], api_key)
-    elif args.provider == "gemini":
-        api_key = os.environ.get("GEMINI_API_KEY")
-        response = gemini.generate_text("gemini-2.5-pro-preview-06-05", request_payload["system_instruction"], request_payload["command"], api_key)
-    elif args.provider == "github_models":
-        api_key = os.environ.get("GITHUB_MODELS_API_KEY")
-        response = github_models.generate_text("openai/gpt-4.1-mini", request_payload["system_instruction"], request_payload["command"], api_key)
-    else:
-        log(f"Provider '{args.provider}' is currently not supported.", "error")
-        sys.exit(1)
+    response = generate(provider_list, commit_info, diff, repo, args)
 
     log("Completed generating changelog.", "info")
 
     if response["error"] is True:
+        if response.get("partial"):
+            log("Saving partial changelog to file", "warning")
+            save_changelog(response["message"], partial=True)
         sys.exit(1)
     else:
         log("Adding changelog to file", "info")
-
-        payload = { "changelog": f"{response["message"]}" }
-        with open("./.github/changelog.json", "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False)
+        save_changelog(response["message"])
 
         log("Changelog added to file successfully.", "info")
 
@@ -3,28 +3,31 @@ import json
 import os
 import sys
 
-from ai import openai, anthropic, gemini, github_models
-from helpers import log, sanitize
+import diff_chunker
+from ai import cache, hedge, providers, telemetry
+from helpers import log, read_argument, sanitize
 
-def create_payload(diff, repo):
-    system_instruction = f"""
-    You are an expert programmer that can do review on critical issues on different type of files.
-    You have access to to the whole contents of the changed files, file specific squashed diffs, and file specific relevant commits.
-    The target audience is the developer that has made the changes and who is only interested in critical issues.
-    The code you are reviewing has already been compiled successfully so there cannot be any syntax errors.
-              
-    Here are the diff logs of the changed files:
-    {diff}
-    """
+MODELS = {
+    "openai": "gpt-4.1",
+    "anthropic": "claude-sonnet-4-20250514",
+    "gemini": "gemini-2.5-pro-preview-06-05",
+    "github_models": "openai/gpt-4.1"
+}
 
-    command = f"""
+OUTPUT_FILE = "./.github/code_review.json"
+STREAM_FILE = "./.github/code_review.{provider}.partial.md"
+
+# Static instructions come first and the diff last,
+# so the providers can cache the shared prompt prefix between runs
+def create_instructions(repo):
+    return f"""
     Please ONLY comment on the following critical issues in the changed files:
     - Clear typos
     - Clear errors in logic
     - Comments not matching the code
               
-    Base your analysis on the full file content and use the file diff as a guide to ONLY comment on the changed parts.
-    Do not include the the diff parts in your output, rather include relevant lines from the full file content.
+    Base your analysis on the state of the code after the last commit that changed it and ONLY comment on the changed parts.
+    Do not include the diff markers in your output, rather include the relevant lines as they are after the last commit.
     ONLY comment on the critical issues and do not include any other issues. If there are no critical issues, tell the developer that there are no critical issues.
               
     Only base your answer on the available files.
@@ -36,6 +39,21 @@ def create_payload(diff, repo):
     Use GitHub markdown syntax in your response. Do not wrap the response in ```markdown.
     """
 
+def create_payload(diff, repo):
+    system_instruction = f"""
+    You are an expert programmer that can do review on critical issues on different type of files.
+    You have access to the diff log of the changed files, with one patch per commit in date order, oldest first.
+    Each patch starts with a '# Commit' line naming the commit. Later commits supersede the changes of earlier ones.
+    The target audience is the developer that has made the changes and who is only interested in critical issues.
+    The code you are reviewing has already been compiled successfully so there cannot be any syntax errors.
+    {create_instructions(repo)}
+    """
+
+    command = f"""
+    Here are the diff logs of the changed files, one patch per commit in date order:
+    {diff}
+    """
+
     payload = {
         "system_instruction": system_instruction,
         "command": command
@@ -43,49 +61,132 @@ def create_payload(diff, repo):
 
     return payload
 
+def create_chunk_payload(diff, repo):
+    system_instruction = f"""
+    You are an expert programmer that can do review on critical issues on different type of files.
+    You have access to one part of a larger diff log of the changed files, with one patch per commit in date order, oldest first.
+    Each patch starts with a '# Commit' line naming the commit. Later commits supersede the changes of earlier ones.
+    Your findings will be merged with the findings of the other parts into a single code review.
+    The code you are reviewing has already been compiled successfully so there cannot be any syntax errors.
+
+    Please ONLY list the following critical issues in the changed parts of this diff log:
+    - Clear typos
+    - Clear errors in logic
+    - Comments not matching the code
+
+    For each issue, include the file name and small amount of surrounding lines to give context for the issue.
+    Note that '{repo}/' is not written in the original logs, so you write that on your own when giving file structures.
+    If there are no critical issues, only answer with 'No critical issues'.
+    Do not add an introduction or closing remarks.
+    """
+
+    command = f"""
+    Here is this part of the diff logs of the changed files, one patch per commit in date order:
+    {diff}
+    """
+
+    payload = {
+        "system_instruction": system_instruction,
+        "command": command
+    }
+
+    return payload
+
+def create_reduce_payload(findings, repo):
+    merged_findings = "\n\n".join(findings)
+    system_instruction = f"""
+    You are an expert programmer that can do review on critical issues on different type of files.
+    The diff logs of the changed files were too large to review at once, so they were split into parts and each part was reviewed separately.
+    The diff logs have one patch per commit in date order, so later parts hold later commits, which supersede the changes of earlier ones.
+    Leave out the issues of an earlier part that a later part fixes.
+    The target audience is the developer that has made the changes and who is only interested in critical issues.
+    {create_instructions(repo)}
+    """
+
+    command = f"""
+    Here are the critical issues found in each part, in date order:
+    {merged_findings}
+    """
+
+    payload = {
+        "system_instruction": system_instruction,
+        "command": command
+    }
+
+    return payload
+
+def save_code_review(message, path=OUTPUT_FILE, partial=False):
+    payload = { "code_review": message }
+    if partial:
+        payload["partial"] = True
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+
+# Generate the code review with the providers hedged in order of preference, chunking the diff when it is too large.
+# args holds the hedge delay, chunking, chunk token budget and stream options of the command line.
+def generate(provider_list, diff, repo, args):
+    return hedge.generate_text(
+        provider_list,
+        lambda provider, cancel_event: diff_chunker.generate_text(
+            provider,
+            MODELS[provider],
+            diff,
+            lambda diff: create_payload(diff, repo),
+            lambda chunk: create_chunk_payload(chunk, repo),
+            lambda findings: create_reduce_payload(findings, repo),
+            chunking=args.chunking,
+            max_chunk_tokens=args.max_chunk_tokens,
+            stream_file=STREAM_FILE.format(provider=provider) if args.stream else None,
+            cancel_event=cancel_event
+        ),
+        args.hedge_delay
+    )
+
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
-    p.add_argument('--diff', required=True)
-    p.add_argument('--provider', required=True)
+    diff_group = p.add_mutually_exclusive_group(required=True)
+    diff_group.add_argument('--diff')
+    diff_group.add_argument('--diff-file', help='Path of the diff file, or - to read it from stdin')
+    p.add_argument('--provider', required=True, help='Provider, or comma separated providers to hedge across in order of preference')
+    p.add_argument('--hedge-delay', type=float, default=hedge.DEFAULT_HEDGE_DELAY, help='Seconds to wait for a provider before also starting the next one')
+    p.add_argument('--no-cache', action='store_true', help='Always call the provider, bypassing the response cache')
+    p.add_argument('--cache-dir', default=cache.DEFAULT_CACHE_DIR, help='Directory of the response cache')
+    p.add_argument('--metrics-file', default=telemetry.default_metrics_file(), help='File the per-call metrics are appended to as JSON lines')
+    p.add_argument('--no-metrics', action='store_true', help='Do not record per-call metrics')
+    p.add_argument('--stream', action='store_true', help=f'Stream the response, writing it to {STREAM_FILE} as it arrives')
+    p.add_argument('--chunking', choices=diff_chunker.CHUNKING_MODES, default='auto', help='Split the diff into chunks that are reviewed in parallel and merged')
+    p.add_argument('--max-chunk-tokens', type=int, help='Token budget of a single chunk (default depends on the model)')
     args = p.parse_args()
 
+    cache.configure(enabled=not args.no_cache, cache_dir=args.cache_dir)
+    telemetry.configure(None if args.no_metrics else args.metrics_file)
+
     repo = os.environ.get("GITHUB_REPOSITORY").split("/")[0]
     branch = os.environ.get("GITHUB_REF_NAME")
     actor = os.environ.get("GITHUB_ACTOR");
 
-    log("Creating payload for code review generation...", "info") 
-    request_payload = create_payload(sanitize(args.diff), repo)
-    log("Completed creating payload for code review generation.", "info")
+    provider_list = providers.parse_list(args.provider)
+    for provider in provider_list:
+        if not providers.is_supported(provider):
+            log(f"Provider '{provider}' is currently not supported.", "error")
+            sys.exit(1)
+
+    diff = sanitize(read_argument(args.diff, args.diff_file))
 
     log("Generating code review...", "info")
 
-    response = None
-    if args.provider == "openai":
-        api_key = os.environ.get("OPENAI_API_KEY")
-        response = openai.generate_text("gpt-4.1", request_payload["system_instruction"], request_payload["command"], api_key)
-    elif args.provider == "anthropic":
-        api_key = os.environ.get("ANTHROPIC_API_KEY")
-        response = anthropic.generate_text("claude-sonnet-4-20250514", request_payload["system_instruction"], request_payload["command"], api_key)
-    elif args.provider == "gemini":
-        api_key = os.environ.get("GEMINI_API_KEY")
-        response = gemini.generate_text("gemini-2.5-pro-preview-06-05", request_payload["system_instruction"], request_payload["command"], api_key)
-    elif args.provider == "github_models":
-        api_key = os.environ.get("GITHUB_MODELS_API_KEY")
-        response = github_models.generate_text("openai/gpt-4.1", request_payload["system_instruction"], request_payload["command"], api_key)
-    else:
-        log(f"Provider '{args.provider}' is currently not supported.", "error")
-        sys.exit(1)
+    response = generate(provider_list, diff, repo, args)
 
     log("Completed generating code review.", "info")
 
     if response["error"] is True:
+        if response.get("partial"):
+            log("Saving partial code review to file", "warning")
+            save_code_review(response["message"], partial=True)
         sys.exit(1)
     else:
         log("Adding code review to file", "info")
-
-        payload = { "code_review": f"{response["message"]}" }
-        with open("./.github/code_review.json", "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False)
+        save_code_review(response["message"])
 
         log("Code review added to file successfully.", "info")
 
@@ -3,20 +3,30 @@ import json
 import os
 import sys
 
-from ai import openai, anthropic, gemini, github_models
-from helpers import log, sanitize
+import failure_index
+import log_compressor
+import log_triage
+from ai import cache, hedge, providers, telemetry
+from helpers import log, read_argument, sanitize
 
+MODELS = {
+    "openai": "gpt-4.1",
+    "anthropic": "claude-sonnet-4-20250514",
+    "gemini": "gemini-2.5-pro-preview-06-05",
+    "github_models": "openai/gpt-4.1"
+}
+
+OUTPUT_FILE = "./.github/error_analysis.json"
+STREAM_FILE = "./.github/error_analysis.{provider}.partial.md"
+
+# Static instructions come first and the logs last,
+# so the providers can cache the shared prompt prefix between runs
 def create_payload(logs, repo):
     system_instruction = f"""
     You are an expert programmer that can analyze the reason(s) why a given software build has failed in a GitHub Actions workflow.
     You have access to the workflow source and the logs of the build steps.
     The target audience is an expert software developer that needs help to understand why the build has failed.
               
-    Here are the build logs:
-    {logs}
-    """
-
-    command = f"""
     Please analyze the given build step log files and give explanation why the build failed with following sections:
     - Full error message
     - Analysis of the error
@@ -37,6 +47,11 @@ def create_payload(logs, repo):
     Use GitHub markdown syntax in your response. Do not wrap the response in ```markdown.
     """
 
+    command = f"""
+    Here are the build logs:
+    {logs}
+    """
+
     payload = {
         "system_instruction": system_instruction,
         "command": command
@@ -44,50 +59,113 @@ def create_payload(logs, repo):
 
     return payload
 
+def save_error_analysis(message, path=OUTPUT_FILE, partial=False):
+    payload = { "error_analysis": message }
+    if partial:
+        payload["partial"] = True
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
-    p.add_argument('--logs', required=True)
+    logs_group = p.add_mutually_exclusive_group(required=True)
+    logs_group.add_argument('--logs')
+    logs_group.add_argument('--logs-file', help='Path of the logs file, or - to read it from stdin')
     p.add_argument('--slack-id', required=False, default="")
-    p.add_argument('--provider', required=True)
+    p.add_argument('--provider', required=True, help='Provider, or comma separated providers to hedge across in order of preference')
+    p.add_argument('--hedge-delay', type=float, default=hedge.DEFAULT_HEDGE_DELAY, help='Seconds to wait for a provider before also starting the next one')
+    p.add_argument('--no-cache', action='store_true', help='Always call the provider, bypassing the response cache')
+    p.add_argument('--cache-dir', default=cache.DEFAULT_CACHE_DIR, help='Directory of the response cache')
+    p.add_argument('--metrics-file', default=telemetry.default_metrics_file(), help='File the per-call metrics are appended to as JSON lines')
+    p.add_argument('--no-metrics', action='store_true', help='Do not record per-call metrics')
+    p.add_argument('--stream', action='store_true', help=f'Stream the response, writing it to {STREAM_FILE} as it arrives')
+    p.add_argument('--failure-index-file', default=failure_index.DEFAULT_INDEX_FILE, help='Index of past error analyses by error fingerprint')
+    p.add_argument('--no-failure-index', action='store_true', help='Always call the provider instead of reusing the analysis of a similar past failure')
+    p.add_argument('--similarity', type=float, default=failure_index.DEFAULT_SIMILARITY, help='Estimated similarity of the errors above which a past analysis is reused (0-1)')
+    p.add_argument('--no-triage', action='store_true', help='Send the whole logs instead of only the lines around errors and the last lines')
+    p.add_argument('--no-compress', action='store_true', help='Do not collapse repeated lines and blocks of lines')
+    p.add_argument('--before-lines', type=int, default=log_triage.DEFAULT_BEFORE_LINES, help='Lines kept before each error')
+    p.add_argument('--after-lines', type=int, default=log_triage.DEFAULT_AFTER_LINES, help='Lines kept after each error')
+    p.add_argument('--tail-lines', type=int, default=log_triage.DEFAULT_TAIL_LINES, help='Last lines of the logs that are always kept')
     args = p.parse_args()
 
+    cache.configure(enabled=not args.no_cache, cache_dir=args.cache_dir)
+    telemetry.configure(None if args.no_metrics else args.metrics_file)
+
     repo = os.environ.get("GITHUB_REPOSITORY").split("/")[0]
     branch = os.environ.get("GITHUB_REF_NAME")
 
     log("Creating payload for error analysis generation...", "info") 
-    request_payload = create_payload(sanitize(args.logs), repo)
+    logs = ""
+    if args.logs is not None or args.logs_file == "-" or os.path.exists(args.logs_file):
+        if args.no_triage:
+            logs = read_argument(args.logs, args.logs_file)
+            if not args.no_compress:
+                logs = "\n".join(log_compressor.compress(logs.splitlines()))
+        else:
+            triage_options = { "compress": not args.no_compress, "before": args.before_lines, "after": args.after_lines, "tail": args.tail_lines }
+            if args.logs is not None:
+                logs = log_triage.triage_text(args.logs, **triage_options)
+            else:
+                logs = log_triage.triage_file(args.logs_file, **triage_options)
+    if not logs.strip():
+        logs = "No logs captured. Make sure every step uses tee -a github_action_logs/all.log"
+    request_payload = create_payload(sanitize(logs), repo)
     log("Completed creating payload for error analysis generation.", "info")
 
+    # Builds often fail for the same reason, reuse the analysis of a similar past failure
+    index = None
+    fingerprint = None
+    if not args.no_failure_index:
+        index = failure_index.FailureIndex(args.failure_index_file)
+        fingerprint = failure_index.fingerprint(logs)
+        if fingerprint is None:
+            log("The logs only show generic errors, not looking for a similar past failure.", "info")
+        match = index.find(fingerprint, args.similarity) if fingerprint else None
+        if match:
+            entry, entry_similarity = match
+            log(f"Errors match the failure of run {entry['run_id']} ({entry_similarity:.0%} similar), reusing its analysis.", "info")
+            save_error_analysis(entry["analysis"])
+            index.save()
+            log("Error analysis generated.", "success")
+            sys.exit(0)
+
     log("Generating error analysis...", "info")
     
-    response = None
-    if args.provider == "openai":
-        api_key = os.environ.get("OPENAI_API_KEY")
-        response = openai.generate_text("gpt-4.1", request_payload["system_instruction"], request_payload["command"], api_key)
-    elif args.provider == "anthropic":
-        api_key = os.environ.get("ANTHROPIC_API_KEY")
-        response = anthropic.generate_text("claude-sonnet-4-20250514", request_payload["system_instruction"], request_payload["command"], api_key)
-    elif args.provider == "gemini":
-        api_key = os.environ.get("GEMINI_API_KEY")
-        response = gemini.generate_text("gemini-2.5-pro-preview-06-05", request_payload["system_instruction"], request_payload["command"], api_key)
-    elif args.provider == "github_models":
-        api_key = os.environ.get("GITHUB_MODELS_API_KEY")
-        response = github_models.generate_text("openai/gpt-4.1", request_payload["system_instruction"], request_payload["command"], api_key)
-    else:
-        log(f"Provider '{args.provider}' is currently not supported.", "error")
-        sys.exit(1)
+    provider_list = providers.parse_list(args.provider)
+    for provider in provider_list:
+        if not providers.is_supported(provider):
+            log(f"Provider '{provider}' is currently not supported.", "error")
+            sys.exit(1)
+
+    response = hedge.generate_text(
+        provider_list,
+        lambda provider, cancel_event: providers.generate_text(
+            provider,
+            MODELS[provider],
+            request_payload["system_instruction"],
+            request_payload["command"],
+            STREAM_FILE.format(provider=provider) if args.stream else None,
+            cancel_event
+        ),
+        args.hedge_delay
+    )
 
     log("Completed generating error analysis.", "info")
 
     if response["error"] is True:
+        if response.get("partial"):
+            log("Saving partial error analysis to file", "warning")
+            save_error_analysis(response["message"], partial=True)
         sys.exit(1)
     else:
         log("Adding error analysis to file", "info")
-
-        payload = { "error_analysis": f"{response["message"]}" }
-        with open("./.github/error_analysis.json", "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False)
+        save_error_analysis(response["message"])
 
         log("Error analysis added to file successfully.", "info")
 
+        if fingerprint:
+            index.add(fingerprint, response["message"], os.environ.get("GITHUB_RUN_ID"))
+            index.save()
+
         log("Error analysis generated.", "success")
@@ -1,23 +1,20 @@
 import argparse
 import os
+import shutil
 import subprocess
-import sys
 import json
 import requests
+from datetime import datetime, timezone
 
+import diff_filter
+import git_data
+import github_api
+import log_triage
 from helpers import log
 
-def run_command(cmd):
-    proc = subprocess.run(cmd, shell=True, text=True, capture_output=True)
+DEFAULT_STATE_FILE = os.path.join(".github", ".build-state", "last-successful.json")
 
-    if proc.returncode != 0:
-        log(f"Failed to run command: {cmd}", "error")
-        log(f"{proc.stderr}", "error")
-        sys.exit(proc.returncode)
-
-    return proc.stdout.strip()
-
-def find_last_successful_run(token, workflow_file_name):
+def find_last_successful_run(token, workflow_file_name, api_url=github_api.API_URL, cache_dir=github_api.DEFAULT_CACHE_DIR):
     repo = os.environ.get("GITHUB_REPOSITORY")
     current_run_id = os.environ.get("GITHUB_RUN_ID")
     branch = os.environ.get("GITHUB_REF_NAME")
@@ -26,42 +23,30 @@ def find_last_successful_run(token, workflow_file_name):
         log("Missing required GitHub environment variables", "error")
         return None
 
-    api_url = f"https://api.github.com/repos/{repo}/actions/workflows/{workflow_file_name}/runs"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/vnd.github+json",
-        "X-GitHub-Api-Version": "2022-11-28"
-    }
+    github = github_api.GitHubClient(token, api_url=api_url, cache_dir=cache_dir)
+    url = f"/repos/{repo}/actions/workflows/{workflow_file_name}/runs"
     params = {
         "branch": branch,
         "status": "success",
-        "per_page": 100
+        # The runs come newest first, the one we are looking for is almost always on the first page
+        "per_page": 10
     }
 
     try:
-        log(f"Querying GitHub API for workflow runs: {api_url}", "info")
-
-        response = requests.get(api_url, headers=headers, params=params)
-        response.raise_for_status()
-
-        runs = response.json().get("workflow_runs", [])
-        log(f"Found {len(runs)} successful workflow runs", "info")
-
-        # Filter out the current run
-        runs = [run for run in runs if str(run["id"]) != current_run_id]
-
-        if not runs:
-            log("No previous successful runs found", "info")
-            return None
+        log(f"Querying GitHub API for workflow runs: {url}", "info")
 
-        # Sort runs by created_at in descending order
-        runs.sort(key=lambda run: run["created_at"], reverse=True)
+        checked = 0
+        for run in github.paginate(url, params, "workflow_runs"):
+            checked += 1
+            # Skip the current run
+            if str(run["id"]) == current_run_id:
+                continue
 
-        # Get the most recent successful run
-        last_successful_run = runs[0]
-        log(f"Last successful run: #{last_successful_run['run_number']} on {last_successful_run['created_at']}", "info")
+            log(f"Last successful run: #{run['run_number']} on {run['created_at']} (checked {checked} runs)", "info")
+            return run["head_sha"]
 
-        return last_successful_run["head_sha"]
+        log("No previous successful runs found", "info")
+        return None
 
     except requests.exceptions.RequestException as e:
         log(f"Failed to query GitHub API: {e}", "error")
@@ -70,6 +55,45 @@ def find_last_successful_run(token, workflow_file_name):
         log(f"Failed to parse API response: {e}", "error")
         return None
 
+# The state file maps each branch to its last successful commit, so the commit range can be found without the API
+def read_last_successful_sha(state_file, branch):
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f).get("branches", {}).get(branch)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if not state:
+        return None
+
+    # The state may come from a cache of another clone, only use commits that exist here
+    proc = subprocess.run(["git", "cat-file", "-e", f"{state['sha']}^{{commit}}"], capture_output=True)
+    if proc.returncode != 0:
+        log(f"Last successful commit {state['sha']} from {state_file} is not in this repository, ignoring it", "warning")
+        return None
+
+    log(f"Last successful run {state['run_id']} found in {state_file}", "info")
+    return state["sha"]
+
+def write_last_successful_sha(state_file, branch, sha, run_id):
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+
+    state.setdefault("branches", {})[branch] = {
+        "sha": sha,
+        "run_id": run_id,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+    os.makedirs(os.path.dirname(state_file) or ".", exist_ok=True)
+    temp_path = f"{state_file}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, state_file)
+
 def get_commit_range(last_successful_sha):
     current_sha = os.environ.get("GITHUB_SHA", "HEAD")
 
@@ -90,30 +114,48 @@ def write_to_github_env(name, value):
     with open(os.environ["GITHUB_ENV"], "a") as env_file:
         env_file.write(f"{name}={value}\n")
 
-def write_multiline_to_github_env(name, value):
-    with open(os.environ["GITHUB_ENV"], "a") as env_file:
-        env_file.write(f"{name}<<EOF\n")
-        env_file.write(value + "\n")
-        env_file.write("EOF\n")
-
-def add_to_logs(message):
+def add_to_logs(message, file_path=None):
     log_dir = os.path.join(os.environ["GITHUB_WORKSPACE"], "github_action_logs")
     os.makedirs(log_dir, exist_ok=True)
 
-    with open(os.path.join(log_dir, "all.log"), "a") as log_file:
-        log_file.write(message + "\n")
+    # Mark the block so log_triage.py can skip it when a later step fails
+    with open(os.path.join(log_dir, "all.log"), "ab") as log_file:
+        log_file.write(f"{log_triage.GIT_CONTEXT_START}\n".encode("utf-8"))
+        log_file.write(message.encode("utf-8"))
+        if file_path:
+            with open(file_path, "rb") as f:
+                shutil.copyfileobj(f, log_file)
+        log_file.write(f"\n{log_triage.GIT_CONTEXT_END}\n".encode("utf-8"))
 
 def main():
     log("Starting to prepare Git context...", "info")
 
     parser = argparse.ArgumentParser(description='Prepare Git context for GitHub Actions')
-    parser.add_argument('--token', required=True, help='GitHub token')
+    parser.add_argument('--token', help='GitHub token, needed when the state file does not know the last successful commit')
     parser.add_argument('--workflow-file-name', default='deploy.yml', help='Workflow file name (default: deploy.yml)')
+    parser.add_argument('--commit-info-file', default='./.github/commit_info.txt', help='File to write the commit information to')
+    parser.add_argument('--diff-file', default='./.github/diff.patch', help='File to write the diff to')
+    parser.add_argument('--git-context-file', default='./.github/git_context.json', help='File to write the commits and their changed files to as JSON')
+    parser.add_argument('--api-cache-dir', default=github_api.DEFAULT_CACHE_DIR, help='Directory of the GitHub API response cache')
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE, help='File holding the last successful commit of each branch')
+    parser.add_argument('--diff-exclude', action='append', default=[], help='Pattern of files to leave out of the diff, can be given multiple times')
+    parser.add_argument('--no-default-excludes', action='store_true', help='Do not leave lockfiles, images and generated files out of the diff')
+    parser.add_argument('--max-file-lines', type=int, default=diff_filter.DEFAULT_MAX_FILE_LINES, help='Leave files with more changed lines out of the diff, 0 for no limit')
+    parser.add_argument('--record-success', action='store_true', help='Record the current commit as the last successful one of its branch and exit')
     args = parser.parse_args()
 
-    # Find the last successful run
+    branch = os.environ.get("GITHUB_REF_NAME")
+
+    if args.record_success:
+        write_last_successful_sha(args.state_file, branch, os.environ.get("GITHUB_SHA"), os.environ.get("GITHUB_RUN_ID"))
+        log(f"Recorded {os.environ.get('GITHUB_SHA')} as the last successful commit of {branch}.", "success")
+        return
+
+    # Find the last successful run, the API is only needed when the state file does not know it
     log("Finding last successful run...", "info")
-    last_successful_sha = find_last_successful_run(args.token, args.workflow_file_name)
+    last_successful_sha = read_last_successful_sha(args.state_file, branch)
+    if not last_successful_sha and args.token:
+        last_successful_sha = find_last_successful_run(args.token, args.workflow_file_name, cache_dir=args.api_cache_dir)
 
     if last_successful_sha:
         log(f"Last successful commit SHA: {last_successful_sha}", "info")
@@ -123,21 +165,24 @@ def main():
     commit_range = get_commit_range(last_successful_sha)
     log(f"Using commit range: {commit_range}", "info")
 
-    # Get commit info
-    log("Retrieving commit information...", "info")
-    commit_info = run_command(f'git log "{commit_range}" --pretty=format:"Commit: %H%nAuthor: %an%nMessage: %s%n"')
-    log(f"Commit information retrieved:\n{commit_info}", "info")
+    # Get the commits, their changed files and the diff in one pass, without the files that only cost tokens
+    log("Retrieving commit and diff information...", "info")
+    excludes = args.diff_exclude + ([] if args.no_default_excludes else diff_filter.DEFAULT_EXCLUDES)
+    context = git_data.extract(commit_range, args.diff_file, excludes, args.max_file_lines)
+    git_data.save(context, args.git_context_file)
 
-    # Get diff
-    log("Retrieving diff information...", "info")
-    diff = run_command(f'git diff "{commit_range}"')
-    log(f"Diff information retrieved.", "info")
+    commit_info = git_data.format_commit_info(context)
+    with open(args.commit_info_file, "w", encoding="utf-8") as f:
+        f.write(commit_info)
+    log(f"Commit information retrieved:\n{commit_info}", "info")
+    log(f"Diff information retrieved ({os.path.getsize(args.diff_file)} bytes).", "info")
 
     # Set environment variables
     log("Setting environment variables...", "info")
     write_to_github_env("COMMIT_RANGE", commit_range)
-    write_multiline_to_github_env("COMMIT_INFO", commit_info)
-    write_multiline_to_github_env("DIFF", diff)
+    write_to_github_env("COMMIT_INFO_FILE", os.path.abspath(args.commit_info_file))
+    write_to_github_env("DIFF_FILE", os.path.abspath(args.diff_file))
+    write_to_github_env("GIT_CONTEXT_FILE", os.path.abspath(args.git_context_file))
     log("Environment variables are set.", "info")
 
     # Log everything
@@ -149,9 +194,8 @@ Commit Info:
 {commit_info}
 
 Diff:
-{diff}
 """
-    add_to_logs(log_message)
+    add_to_logs(log_message, args.diff_file)
     log("Commit information and diff added to logs.", "info")
 
     log("Git context preparation completed.", "success")
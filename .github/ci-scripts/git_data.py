@@ -0,0 +1,171 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import diff_filter
+from helpers import log
+
+# Commit fields separated by a unit separator, each commit starts with a record separator
+LOG_FORMAT = "%x1e%H%x1f%h%x1f%an%x1f%s%x1f%ci"
+
+def parse_header(header):
+    full_hash, short_hash, author, message, date = header.decode("utf-8", errors="replace").split("\x1f", 4)
+    return {
+        "full_hash": full_hash,
+        "short_hash": short_hash,
+        "author": author,
+        "message": message,
+        "date": date,
+        "files": []
+    }
+
+# Parse the NUL separated --numstat output of one commit, None counts for binary files
+def parse_numstat(data):
+    fields = data.decode("utf-8", errors="replace").split("\0")
+    files = []
+    i = 0
+    while i < len(fields):
+        if not fields[i]:
+            i += 1
+            continue
+        added, deleted, path = fields[i].split("\t", 2)
+        i += 1
+        stat = {}
+        if not path:
+            # Renames and copies are followed by the old and the new path
+            stat["old_path"] = fields[i]
+            path = fields[i + 1]
+            i += 2
+        binary = added == "-"
+        stat.update({
+            "path": path,
+            "added": None if binary else int(added),
+            "deleted": None if binary else int(deleted)
+        })
+        files.append(stat)
+    return files
+
+# Sum the changes of all commits per file
+def summarize_files(commits):
+    files = {}
+    for commit in commits:
+        for stat in commit["files"]:
+            summary = files.setdefault(stat["path"], { "added": 0, "deleted": 0, "binary": False, "commits": [] })
+            if stat["added"] is None:
+                summary["binary"] = True
+            else:
+                summary["added"] += stat["added"]
+                summary["deleted"] += stat["deleted"]
+            summary["commits"].append(commit["short_hash"])
+    return files
+
+def format_changes(stat):
+    if stat["added"] is None or stat.get("binary"):
+        return "binary"
+    return f"+{stat['added']} -{stat['deleted']}"
+
+def commit_header(commit):
+    lines = [f"# Commit {commit['short_hash']}: {commit['message']}"]
+    filtered = [stat for stat in commit["files"] if stat.get("filtered")]
+    if filtered:
+        lines.append("# Files left out of this diff:")
+        for stat in filtered:
+            changes = format_changes(stat)
+            # Binary files are left out because they are binary, no need to say so twice
+            details = changes if stat["filtered"] == changes else f"{changes}, {stat['filtered']}"
+            lines.append(f"# {stat['path']} ({details})")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+# Read the commits of a range, their changed files and their patches with a single git log call.
+# The patches are streamed into diff_path, without the files the diff filter leaves out.
+def extract(commit_range, diff_path, excludes=diff_filter.DEFAULT_EXCLUDES, max_file_lines=diff_filter.DEFAULT_MAX_FILE_LINES, repo_path=None):
+    commits = []
+    saved_bytes = 0
+
+    os.makedirs(os.path.dirname(diff_path) or ".", exist_ok=True)
+    with tempfile.TemporaryFile() as stderr, open(diff_path, "wb") as output_file:
+        proc = subprocess.Popen([
+            "git", "log", "-p", "--numstat", "-z", "--reverse", f"--format={LOG_FORMAT}", commit_range, "--"
+        ], cwd=repo_path, stdout=subprocess.PIPE, stderr=stderr)
+
+        # The numstat of a commit follows its header line, the patch follows the numstat
+        expect_numstat = False
+        file_index = -1
+        skip = False
+        for line in proc.stdout:
+            if line.startswith(b"\x1e"):
+                # Commits without changes, like merges, have no numstat and their headers share a line
+                for header in line.rstrip(b"\n").split(b"\0"):
+                    if header.startswith(b"\x1e"):
+                        commits.append(parse_header(header[1:]))
+                expect_numstat = True
+                continue
+
+            if expect_numstat:
+                expect_numstat = False
+                numstat, _, line = line.partition(b"\0\0")
+                commit = commits[-1]
+                commit["files"] = parse_numstat(numstat)
+                for stat in commit["files"]:
+                    reason = diff_filter.filter_reason(stat, excludes, max_file_lines)
+                    if reason:
+                        stat["filtered"] = reason
+                output_file.write(commit_header(commit))
+                file_index = -1
+                skip = False
+                if not line:
+                    continue
+
+            # The patches come in the same order as the numstat
+            if line.startswith(b"diff --git "):
+                file_index += 1
+                files = commits[-1]["files"]
+                skip = file_index < len(files) and "filtered" in files[file_index]
+
+            if skip:
+                saved_bytes += len(line)
+            else:
+                output_file.write(line)
+
+        proc.wait()
+        if proc.returncode != 0:
+            stderr.seek(0)
+            log(f"Failed to run git log for {commit_range}: {stderr.read().decode('utf-8', errors='replace')}", "error")
+            sys.exit(proc.returncode)
+
+    filtered = [stat for commit in commits for stat in commit["files"] if stat.get("filtered")]
+    diff_filter.log_savings(filtered, saved_bytes)
+
+    return {
+        "commit_range": commit_range,
+        # Newest first, like git log
+        "commits": commits[::-1],
+        "files": summarize_files(commits),
+        "saved_bytes": saved_bytes
+    }
+
+# Commit information as text for the prompts, newest commit first
+def format_commit_info(context):
+    entries = [
+        f"Commit: {commit['full_hash']}\nAuthor: {commit['author']}\nMessage: {commit['message']}\n"
+        for commit in context["commits"]
+    ]
+    if context["files"]:
+        lines = ["Changed files:"]
+        lines.extend(
+            f"{path} ({format_changes(summary)}, {', '.join(summary['commits'])})"
+            for path, summary in sorted(context["files"].items())
+        )
+        entries.append("\n".join(lines))
+    return "\n".join(entries)
+
+def save(context, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(context, f, ensure_ascii=False)
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
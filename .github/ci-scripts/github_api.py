@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import time
+
+from ai import client
+from helpers import log
+
+API_URL = "https://api.github.com"
+DEFAULT_CACHE_DIR = os.path.join(".github", ".github-api-cache")
+DEFAULT_TIMEOUT = 10  # Seconds
+MAX_RATE_LIMIT_WAIT = 60  # Seconds, fail instead of waiting longer for a rate limit to reset
+MAX_ATTEMPTS = 3
+
+# Small GitHub REST client.
+# Responses are cached on disk with their ETag, unchanged resources then come back as 304s,
+# which GitHub does not count against the rate limit.
+class GitHubClient:
+    def __init__(self, token, api_url=API_URL, cache_dir=DEFAULT_CACHE_DIR, timeout=DEFAULT_TIMEOUT):
+        self.api_url = api_url
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.session = client.create_session(pool_size=2)
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28"
+        })
+
+    def _cache_path(self, url, params):
+        key = hashlib.sha256(json.dumps([url, params], sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_cache(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_cache(self, path, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+
+    # Seconds to wait before retrying a rate limited response, None if the response is not rate limited
+    def _rate_limit_wait(self, response):
+        if response.status_code not in (403, 429):
+            return None
+
+        # Secondary rate limits tell how long to wait
+        retry_after = response.headers.get("retry-after")
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+
+        if response.headers.get("x-ratelimit-remaining") == "0":
+            reset = response.headers.get("x-ratelimit-reset")
+            return max(int(reset) - time.time(), 0) + 1 if reset and reset.isdigit() else MAX_RATE_LIMIT_WAIT
+
+        return None
+
+    # GET a URL, returns the decoded body and the URL of the next page, if any
+    def get(self, url, params=None):
+        if not url.startswith("http"):
+            url = f"{self.api_url}{url}"
+
+        cache_path = self._cache_path(url, params)
+        cached = self._read_cache(cache_path)
+        headers = { "If-None-Match": cached["etag"] } if cached else {}
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+
+            wait = self._rate_limit_wait(response)
+            if wait is None:
+                break
+            if wait > MAX_RATE_LIMIT_WAIT or attempt == MAX_ATTEMPTS:
+                log(f"GitHub API rate limit exceeded, it resets in {wait:.0f} seconds.", "error")
+                break
+            log(f"GitHub API rate limit exceeded, waiting {wait:.0f} seconds...", "warning")
+            time.sleep(wait)
+
+        remaining = response.headers.get("x-ratelimit-remaining")
+        if remaining and remaining.isdigit() and int(remaining) < 100:
+            log(f"Only {remaining} GitHub API requests left until the rate limit resets.", "warning")
+
+        if response.status_code == 304 and cached:
+            log(f"GitHub API response unchanged: {url}", "info")
+            return cached["body"], cached["next"]
+
+        response.raise_for_status()
+        body = response.json()
+        next_url = response.links.get("next", {}).get("url")
+
+        etag = response.headers.get("etag")
+        if etag:
+            self._write_cache(cache_path, { "etag": etag, "body": body, "next": next_url })
+
+        return body, next_url
+
+    # Yield the items of a paginated list page by page, following the Link headers.
+    # Stop iterating to stop fetching pages.
+    def paginate(self, url, params=None, key=None):
+        while url:
+            body, url = self.get(url, params)
+            # The next page URL already contains the query
+            params = None
+            yield from (body[key] if key else body)
@@ -1,5 +1,11 @@
+import io
+import json
+import os
 import re
 import sys
+import threading
+import time
+from datetime import datetime, timezone
 
 # ASCII color codes for terminal output
 GREEN = "\033[92m"
@@ -8,20 +14,144 @@ PURPLE = "\033[35m"
 RED = "\033[91m"
 RESET = "\033[0m"
 
-# Flush output to ensure immediate display
+# Log levels by message type, "none" is for plain output like generated texts
+LEVELS = {
+    "debug": 10,
+    "none": 20,
+    "info": 20,
+    "success": 25,
+    "warning": 30,
+    "error": 40
+}
+
+PREFIXES = {
+    "debug": "[DEBUG]",
+    "info": f"{PURPLE}[INFO]{RESET}",
+    "warning": f"{YELLOW}[WARNING]{RESET}",
+    "error": f"{RED}[ERROR]{RESET}",
+    "success": f"{GREEN}[SUCCESS]{RESET}"
+}
+
+# Buffered output is flushed at least this often, warnings and errors right away
+FLUSH_INTERVAL = 1.0  # Seconds
+
+# Secrets that end up in logged URLs, headers and error bodies
+SECRET_PATTERNS = [
+    # Query parameters, e.g. the Gemini API key
+    (re.compile(r"([?&](?:key|api_key|apikey|token|access_token|client_secret)=)[^&\s\"']+", re.IGNORECASE), r"\1***"),
+    # Credentials in URLs, e.g. the wiki remote
+    (re.compile(r"(https?://[^:/\s@]+:)[^@\s/]+@"), r"\1***@"),
+    (re.compile(r"(\bBearer\s+)[\w.~+/-]+=*", re.IGNORECASE), r"\1***"),
+    (re.compile(r"(\b(?:x-api-key|x-goog-api-key|authorization)[\"']?\s*[:=]\s*[\"']?)[^\s\"',}]+", re.IGNORECASE), r"\1***"),
+    # Well-known token formats
+    (re.compile(r"\b(?:sk-[\w-]{16,}|gh[pousr]_\w{20,}|github_pat_\w{20,}|AIza[\w-]{30,})"), "***")
+]
+
+_config = {
+    "level": LEVELS.get(os.environ.get("CI_LOG_LEVEL", "info").lower(), LEVELS["info"]),
+    "json": os.environ.get("CI_LOG_FORMAT", "text").lower() == "json"
+}
+_lock = threading.Lock()
+_state = {
+    "dirty": False,
+    "flusher": None
+}
+
+# Set the lowest level that is logged and whether to log JSON lines instead of text,
+# both default to the CI_LOG_LEVEL and CI_LOG_FORMAT environment variables
+def configure(level=None, json_lines=None):
+    if level is not None:
+        _config["level"] = LEVELS[level]
+    if json_lines is not None:
+        _config["json"] = json_lines
+
+# Cheap check before running the patterns, every secret pattern contains one of these
+SECRET_MARKERS = ["=", "@", "bearer", "key", "authorization", "sk-", "ghp_", "gho_", "ghu_", "ghs_", "ghr_", "github_pat_", "aiza"]
+
+def redact(text):
+    lowered = text.lower()
+    if not any(marker in lowered for marker in SECRET_MARKERS):
+        return text
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+def flush():
+    with _lock:
+        sys.stdout.flush()
+        _state["dirty"] = False
+
+# Flush buffered messages in the background, so they show up in time while a step waits on a response
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        if _state["dirty"]:
+            flush()
+
+# Write a message to stdout, redacting secrets.
+# Messages are buffered, only warnings and errors are flushed right away.
 def log(message="", type="none"):
-    message_prefix = ""
-    if type == "info":
-        message_prefix = f"{PURPLE}[INFO]{RESET}"
-    elif type == "warning":
-        message_prefix = f"{YELLOW}[WARNING]{RESET}"
-    elif type == "error":
-        message_prefix = f"{RED}[ERROR]{RESET}"
-    elif type == "success":
-        message_prefix = f"{GREEN}[SUCCESS]{RESET}"
-    print(f"{message_prefix} {message}", flush=True)
-    sys.stdout.flush()
+    level = LEVELS.get(type, LEVELS["info"])
+    if level < _config["level"]:
+        return
+
+    message = redact(str(message))
+    if _config["json"]:
+        line = json.dumps({
+            "time": datetime.now(timezone.utc).isoformat(),
+            "level": type,
+            "message": message
+        }, ensure_ascii=False)
+    else:
+        line = f"{PREFIXES.get(type, '')} {message}"
+
+    with _lock:
+        sys.stdout.write(line + "\n")
+        if level >= LEVELS["warning"]:
+            sys.stdout.flush()
+            _state["dirty"] = False
+        else:
+            _state["dirty"] = True
+            if _state["flusher"] is None:
+                _state["flusher"] = threading.Thread(target=_flush_periodically, daemon=True)
+                _state["flusher"].start()
 
 # Sanitize text
 def sanitize(text):
-    return re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
\ No newline at end of file
+    return re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
+
+# Upper limit of text read from an input file, anything beyond it is cut off
+MAX_INPUT_BYTES = 32 * 1024 * 1024
+
+# Read text from a file path or stdin ("-") in chunks, keeping at most max_bytes in memory
+def read_input(path, max_bytes=MAX_INPUT_BYTES):
+    chunk_size = 1024 * 1024
+    stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+
+    try:
+        data = io.BytesIO()
+        truncated = False
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            remaining = max_bytes - data.tell()
+            if len(chunk) > remaining:
+                data.write(chunk[:remaining])
+                truncated = True
+                break
+            data.write(chunk)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+    if truncated:
+        log(f"Input '{path}' is larger than {max_bytes} bytes and was truncated.", "warning")
+
+    return data.getvalue().decode("utf-8", errors="replace")
+
+# Return the text given directly on the command line, or read it from the given file
+def read_argument(text, path):
+    if text is not None:
+        return text
+    return read_input(path)
@@ -0,0 +1,99 @@
+import re
+
+from helpers import log
+
+# Terminal escape sequences, including the colors of helpers.log
+ANSI_PATTERN = re.compile(r"\x1b\[[0-9;?]*[ -/]*[@-~]")
+
+# Parts of a line that change between otherwise identical lines are ignored when comparing lines.
+# Numbers are replaced first, which also covers timestamps, durations, sizes and progress,
+# then the hex strings they were part of, like hashes and ids.
+NUMBER_PATTERN = re.compile(r"\d+")
+HEX_PATTERN = re.compile(r"[0-9a-fA-F#]*#[0-9a-fA-F#]*")
+
+# Longest block of lines that is detected as repeating
+DEFAULT_MAX_BLOCK_LINES = 8
+
+def clean(line):
+    line = line.rstrip("\r\n")
+    if "\x1b" in line:
+        line = ANSI_PATTERN.sub("", line)
+    # Progress bars redraw the line after a carriage return, only the last state is visible
+    return line.rsplit("\r", 1)[-1]
+
+def normalize(line):
+    line = NUMBER_PATTERN.sub("#", line)
+    return HEX_PATTERN.sub("#", line) if "#" in line else line
+
+def format_repeat(block, count):
+    if len(block) == 1:
+        return [f"{block[0][1]} (×{count})"]
+    return [line for _, line in block] + [f"(previous {len(block)} lines ×{count})"]
+
+# Collapse runs of identical lines, and of identical blocks of up to max_block_lines lines,
+# into the first occurrence and a (×N) marker. Lines are compared after normalizing
+# timestamps, hashes and numbers, and are returned without ANSI codes.
+# Only the last few lines are kept in memory, so logs of any size can be streamed through.
+def compress(lines, max_block_lines=DEFAULT_MAX_BLOCK_LINES):
+    # Recent (key, line) pairs that may still start a repetition
+    recent = []
+    # The repeating block, how often it was seen and the lines of its next repetition matched so far
+    block = None
+    count = 0
+    matched = []
+    line_count = 0
+    output_count = 0
+
+    for raw_line in lines:
+        line_count += 1
+        line = clean(raw_line)
+        queue = [(normalize(line), line)]
+
+        while queue:
+            entry = queue.pop(0)
+
+            if block:
+                if entry[0] == block[len(matched)][0]:
+                    matched.append(entry)
+                    if len(matched) == len(block):
+                        count += 1
+                        matched = []
+                    continue
+
+                # The repetition ended, the partly matched lines may start another one
+                for output in format_repeat(block, count):
+                    output_count += 1
+                    yield output
+                queue = matched + [entry] + queue
+                block = None
+                matched = []
+                continue
+
+            recent.append(entry)
+            # Try the shortest period first, a line repeating is also a block of two repeating
+            for size in range(1, min(len(recent) // 2, max_block_lines) + 1):
+                if recent[-1][0] == recent[-1 - size][0] and \
+                        [key for key, _ in recent[-size:]] == [key for key, _ in recent[-2 * size:-size]]:
+                    for _, output in recent[:-2 * size]:
+                        output_count += 1
+                        yield output
+                    block = recent[-2 * size:-size]
+                    count = 2
+                    recent = []
+                    break
+            else:
+                if len(recent) > 2 * max_block_lines:
+                    output_count += 1
+                    yield recent.pop(0)[1]
+
+    if block:
+        for output in format_repeat(block, count):
+            output_count += 1
+            yield output
+        recent = matched
+    for _, output in recent:
+        output_count += 1
+        yield output
+
+    if line_count > output_count:
+        log(f"Compressed {line_count} log lines into {output_count} by collapsing repetitions.", "info")
@@ -0,0 +1,121 @@
+import re
+import sys
+from collections import deque
+
+import log_compressor
+from helpers import log
+
+# generate_git_context.py wraps the commit info and diff it appends to the logs in these lines,
+# they are no build output and are skipped
+GIT_CONTEXT_START = "=== git context start ==="
+GIT_CONTEXT_END = "=== git context end ==="
+
+# Lines that point to the cause of a failure
+ERROR_PATTERNS = [
+    # helpers.log
+    r"\[ERROR\]",
+    # Dart and Flutter
+    r"\.dart:\d+:\d+: Error:",
+    r"^\s*error • ",
+    r"^Error: ",
+    r"Unhandled exception",
+    r"version solving failed",
+    r"^Target \S+ failed",
+    r"Gradle task \S+ failed",
+    # Gradle and Kotlin
+    r"^FAILURE: ",
+    r"^\* What went wrong:",
+    r"^BUILD FAILED",
+    r"^> Task \S+ FAILED",
+    r"^e: ",
+    # Xcode, Swift and Clang
+    r"^Error \(Xcode\):",
+    r":\d+:\d+: error:",
+    r"\*\* BUILD FAILED \*\*",
+    # Python
+    r"^Traceback \(most recent call last\)",
+    # Non-zero exits
+    r"exit(ed with)? (code|value) [1-9]",
+    r"returned non-zero exit status",
+]
+ERROR_PATTERN = re.compile("|".join(f"(?:{pattern})" for pattern in ERROR_PATTERNS))
+
+DEFAULT_BEFORE_LINES = 10
+DEFAULT_AFTER_LINES = 20
+DEFAULT_TAIL_LINES = 100
+DEFAULT_MAX_LINES = 2000  # Lines kept around errors, the tail comes on top
+
+def is_error(line):
+    return ERROR_PATTERN.search(line) is not None
+
+# Keep the lines around errors and the last lines of the logs, reading them only once.
+# Returns the numbered lines that are kept and the number of lines read.
+def select_lines(lines, before=DEFAULT_BEFORE_LINES, after=DEFAULT_AFTER_LINES, tail=DEFAULT_TAIL_LINES, max_lines=DEFAULT_MAX_LINES):
+    kept = []
+    previous = deque(maxlen=before)
+    last = deque(maxlen=tail)
+    keep_until = 0
+    in_git_context = False
+    line_number = 0
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\n")
+        if line == GIT_CONTEXT_START:
+            in_git_context = True
+            continue
+        if line == GIT_CONTEXT_END:
+            in_git_context = False
+            continue
+        if in_git_context:
+            continue
+
+        last.append((line_number, line))
+        if len(kept) >= max_lines:
+            continue
+
+        if is_error(line):
+            # Start a new window, or keep the current one open
+            kept.extend(previous)
+            previous.clear()
+            kept.append((line_number, line))
+            keep_until = line_number + after
+        elif line_number <= keep_until:
+            kept.append((line_number, line))
+        else:
+            previous.append((line_number, line))
+
+    last_kept = kept[-1][0] if kept else 0
+    kept.extend(entry for entry in last if entry[0] > last_kept)
+    return kept, line_number
+
+# Join the kept lines, marking where lines were left out
+def format_lines(kept, line_count):
+    output = []
+    previous = 0
+    for line_number, line in kept:
+        if line_number > previous + 1:
+            output.append(f"[... {line_number - previous - 1} lines omitted ...]")
+        output.append(line)
+        previous = line_number
+    if line_count > previous:
+        output.append(f"[... {line_count - previous} lines omitted ...]")
+    return "\n".join(output)
+
+def reduce_lines(lines, compress, options):
+    if compress:
+        lines = log_compressor.compress(lines)
+    kept, line_count = select_lines(lines, **options)
+    text = format_lines(kept, line_count)
+    log(f"Reduced the logs from {line_count} to {len(kept)} lines ({len(text)} characters) around errors and at the end.", "info")
+    return text
+
+# Reduce the logs of a file, or stdin for "-", to the parts that explain a failure.
+# Repetitions are collapsed first, unless compress is False.
+def triage_file(path, compress=True, **options):
+    if path == "-":
+        return reduce_lines(sys.stdin, compress, options)
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return reduce_lines(f, compress, options)
+
+def triage_text(text, compress=True, **options):
+    return reduce_lines(text.splitlines(), compress, options)
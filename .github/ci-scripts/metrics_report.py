@@ -0,0 +1,108 @@
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+
+from ai import telemetry
+from helpers import log
+
+# Read all records of the given metrics files, directories are searched for *.jsonl files
+def load_records(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "*.jsonl"), recursive=True)))
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            log(f"Skipping {path}, it does not exist.", "warning")
+
+    records = []
+    for file in files:
+        with open(file, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    log(f"Skipping malformed line {line_number} of {file}", "warning")
+    return records
+
+# Nearest-rank percentile of a list of numbers
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.1f}s"
+
+# Aggregate the records per provider and model
+def summarize(records):
+    groups = {}
+    for record in records:
+        groups.setdefault((record["provider"], record["model"]), []).append(record)
+
+    rows = []
+    for (provider, model), group in sorted(groups.items()):
+        # Cache hits never reach the provider, keep them out of the latency percentiles
+        calls = [record for record in group if not record["cache_hit"]]
+        latencies = [record["total"] for record in calls if not record["error"] and record["total"] is not None]
+        ttfbs = [record["ttfb"] for record in calls if not record["error"] and record.get("ttfb") is not None]
+        costs = [record["cost"] for record in group if record.get("cost") is not None]
+
+        rows.append({
+            "provider": provider,
+            "model": model,
+            "calls": len(group),
+            "errors": sum(1 for record in group if record["error"]),
+            "cache_hits": sum(1 for record in group if record["cache_hit"]),
+            "retries": sum(max(record["attempts"] - 1, 0) for record in calls),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "ttfb_p50": percentile(ttfbs, 50),
+            "input_tokens": sum(record["input_tokens"] for record in group),
+            "cached_tokens": sum(record["cached_tokens"] for record in group),
+            "output_tokens": sum(record["output_tokens"] for record in group),
+            "cost": sum(costs),
+            "unpriced": len(group) - len(costs)
+        })
+    return rows
+
+def print_report(rows):
+    header = f"{'Provider':<15}{'Model':<32}{'Calls':>7}{'Errors':>8}{'Cached':>8}{'Retries':>9}{'p50':>9}{'p95':>9}{'TTFB p50':>10}{'Input':>11}{'Output':>10}{'Spend':>11}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        spend = f"${row['cost']:.4f}" + ("*" if row["unpriced"] else "")
+        print(
+            f"{row['provider']:<15}{row['model']:<32}{row['calls']:>7}{row['errors']:>8}{row['cache_hits']:>8}{row['retries']:>9}"
+            f"{format_seconds(row['p50']):>9}{format_seconds(row['p95']):>9}{format_seconds(row['ttfb_p50']):>10}"
+            f"{row['input_tokens']:>11}{row['output_tokens']:>10}{spend:>11}"
+        )
+    print("-" * len(header))
+    total_spend = f"${sum(row['cost'] for row in rows):.4f}"
+    print(f"{'Total':<47}{sum(row['calls'] for row in rows):>7}{'':>74}{total_spend:>11}")
+    if any(row["unpriced"] for row in rows):
+        print("* Some calls used a model without a known price and are not included in the spend.")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Print latency percentiles and spend per provider from the AI metrics files')
+    p.add_argument('paths', nargs='*', default=[telemetry.DEFAULT_METRICS_DIR], help='Metrics files or directories containing them')
+    p.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = p.parse_args()
+
+    records = load_records(args.paths)
+    if not records:
+        log("No metrics found.", "warning")
+        sys.exit(0)
+
+    rows = summarize(records)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_report(rows)
@@ -0,0 +1,107 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import diff_chunker
+import generate_changelog
+import generate_code_review
+from ai import cache, hedge, providers, telemetry
+from helpers import log, read_argument, sanitize
+
+# Generate the output of a single task and write it to its file as soon as it is done
+def run_task(name, provider, generate, save):
+    start_time = time.monotonic()
+    log(f"Generating {name} with {provider}...", "info")
+
+    response = generate()
+    if response["error"] is False:
+        save(response["message"])
+        log(f"{name.capitalize()} added to file successfully.", "info")
+    elif response.get("partial"):
+        save(response["message"], partial=True)
+        log(f"Partial {name} added to file.", "warning")
+
+    return response, time.monotonic() - start_time
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Generate changelog and code review concurrently')
+    commit_info_group = p.add_mutually_exclusive_group(required=True)
+    commit_info_group.add_argument('--commit-info')
+    commit_info_group.add_argument('--commit-info-file', help='Path of the commit information file, or - to read it from stdin')
+    diff_group = p.add_mutually_exclusive_group(required=True)
+    diff_group.add_argument('--diff')
+    diff_group.add_argument('--diff-file', help='Path of the diff file, or - to read it from stdin')
+    p.add_argument('--changelog-provider', default='openai', help='Provider, or comma separated providers to hedge across')
+    p.add_argument('--code-review-provider', default='anthropic', help='Provider, or comma separated providers to hedge across')
+    p.add_argument('--hedge-delay', type=float, default=hedge.DEFAULT_HEDGE_DELAY, help='Seconds to wait for a provider before also starting the next one')
+    p.add_argument('--no-cache', action='store_true', help='Always call the providers, bypassing the response cache')
+    p.add_argument('--cache-dir', default=cache.DEFAULT_CACHE_DIR, help='Directory of the response cache')
+    p.add_argument('--metrics-file', default=telemetry.default_metrics_file(), help='File the per-call metrics are appended to as JSON lines')
+    p.add_argument('--no-metrics', action='store_true', help='Do not record per-call metrics')
+    p.add_argument('--stream', action='store_true', help='Stream the responses, writing them to disk as they arrive')
+    p.add_argument('--chunking', choices=diff_chunker.CHUNKING_MODES, default='auto', help='Split the diff into chunks that are processed in parallel and merged')
+    p.add_argument('--max-chunk-tokens', type=int, help='Token budget of a single chunk (default depends on the model)')
+    args = p.parse_args()
+
+    cache.configure(enabled=not args.no_cache, cache_dir=args.cache_dir)
+    telemetry.configure(None if args.no_metrics else args.metrics_file)
+
+    repo = os.environ.get("GITHUB_REPOSITORY").split("/")[0]
+
+    changelog_providers = providers.parse_list(args.changelog_provider)
+    code_review_providers = providers.parse_list(args.code_review_provider)
+
+    for provider in changelog_providers + code_review_providers:
+        if not providers.is_supported(provider):
+            log(f"Provider '{provider}' is currently not supported.", "error")
+            sys.exit(1)
+
+    commit_info = sanitize(read_argument(args.commit_info, args.commit_info_file))
+    diff = sanitize(read_argument(args.diff, args.diff_file))
+
+    tasks = {
+        "changelog": (
+            args.changelog_provider,
+            lambda: generate_changelog.generate(changelog_providers, commit_info, diff, repo, args),
+            generate_changelog.save_changelog
+        ),
+        "code review": (
+            args.code_review_provider,
+            lambda: generate_code_review.generate(code_review_providers, diff, repo, args),
+            generate_code_review.save_code_review
+        )
+    }
+
+    pipeline_start_time = time.monotonic()
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = {
+            executor.submit(run_task, name, *task): name
+            for name, task in tasks.items()
+        }
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                response, elapsed = future.result()
+            except Exception as e:
+                log(f"Generating {name} raised an exception: {e}", "error")
+                failed.append(name)
+                continue
+
+            if response["error"] is True:
+                log(f"Failed to generate {name} after {elapsed:.1f}s.", "error")
+                failed.append(name)
+            else:
+                log(f"Generated {name} in {elapsed:.1f}s.", "info")
+
+    log(f"Pipeline finished in {time.monotonic() - pipeline_start_time:.1f}s.", "info")
+
+    if failed:
+        log(f"Failed tasks: {', '.join(failed)}", "error")
+        sys.exit(1)
+
+    log("Changelog and code review generated.", "success")
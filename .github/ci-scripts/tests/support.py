@@ -0,0 +1,137 @@
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# The scripts import each other as top-level modules
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+import helpers
+
+# Keep the test output readable, the scripts log every step
+helpers.configure(level="error")
+
+# Local HTTP server that counts the connections it accepts
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler_class):
+        super().__init__(("127.0.0.1", 0), handler_class)
+        self.connections = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def get_request(self):
+        request = super().get_request()
+        with self.lock:
+            self.connections += 1
+        return request
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+# Keep-alive request handler with helpers to answer with JSON
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        with self.server.lock:
+            self.server.requests.append({ "method": self.command, "path": self.path, "headers": dict(self.headers), "body": body })
+        return body
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+# Silence the output of the code under test, including that of the subprocesses it runs
+@contextlib.contextmanager
+def quiet_stdout():
+    sys.stdout.flush()
+    saved = os.dup(1)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            os.dup2(devnull.fileno(), 1)
+            yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+
+def git(cwd, *args):
+    result = subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, capture_output=True, text=True
+    )
+    return result.stdout.strip()
+
+# Bytes stored in the object database of a checkout, grows by what a clone or fetch transferred
+def object_bytes(repo_path):
+    total = 0
+    for root, _, files in os.walk(os.path.join(repo_path, ".git", "objects")):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+# Bare wiki repository with a master branch, and a checkout of it other writers push from
+class WikiRemote:
+    def __init__(self, root, files):
+        self.path = os.path.join(root, "remote.wiki.git")
+        git(root, "init", "--quiet", "--bare", "--initial-branch", "master", self.path)
+        # Partial clones, like the sparse clone mode, need the server to allow filters
+        git(self.path, "config", "uploadpack.allowFilter", "true")
+        # A file:// URL, git ignores --depth for plain local paths
+        self.url = Path(self.path).as_uri()
+
+        self.work = os.path.join(root, "remote-work")
+        git(root, "init", "--quiet", "--initial-branch", "master", self.work)
+        git(self.work, "remote", "add", "origin", self.url)
+        self.commit(files, "Initial wiki")
+
+    def commit(self, files, message="Update the wiki"):
+        git(self.work, "pull", "--quiet", "origin", "master") if self.head() else None
+        for name, content in files.items():
+            path = os.path.join(self.work, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        git(self.work, "add", "-A")
+        git(self.work, "commit", "--quiet", "-m", message)
+        git(self.work, "push", "--quiet", "origin", "master")
+
+    def head(self):
+        try:
+            return git(self.path, "rev-parse", "--verify", "--quiet", "master")
+        except subprocess.CalledProcessError:
+            return None
+
+    def files(self):
+        return git(self.path, "ls-tree", "-r", "--name-only", "master").splitlines()
+
+    def read(self, name):
+        return git(self.path, "show", f"master:{name}")
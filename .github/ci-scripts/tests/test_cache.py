@@ -0,0 +1,55 @@
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import support
+from ai import cache
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        cache.configure(cache_dir=self.temp_dir.name, max_entries=5)
+
+    def tearDown(self):
+        cache.configure()
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        cache.put("key", { "message": "hello", "error": False })
+        self.assertEqual(cache.get("key"), { "message": "hello", "error": False })
+        self.assertIsNone(cache.get("missing"))
+
+    def test_expired_entry_removed_by_another_writer(self):
+        cache.put("key", { "message": "old", "error": False })
+        cache.configure(cache_dir=self.temp_dir.name, ttl=-1)
+        os.remove(os.path.join(self.temp_dir.name, "key.json"))
+        self.assertIsNone(cache.get("key"))
+        cache.evict()
+
+    def test_concurrent_writers_evicting_the_same_entries(self):
+        def write(i):
+            key = f"key-{i % 20}"
+            cache.put(key, { "message": str(i), "error": False })
+            cache.get(key)
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(write, range(400)))
+
+        names = os.listdir(self.temp_dir.name)
+        self.assertEqual([name for name in names if name.endswith(".tmp")], [])
+        self.assertLessEqual(len(names), 5 + 16)
+
+    def test_eviction_keeps_the_recently_used_entries(self):
+        for i in range(6):
+            cache.put(f"key-{i}", { "message": str(i), "error": False })
+            path = os.path.join(self.temp_dir.name, f"key-{i}.json")
+            os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+        cache.evict()
+
+        self.assertIsNone(cache.get("key-0"))
+        self.assertEqual(cache.get("key-5")["message"], "5")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import socket
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import support
+from ai import client
+
+class EchoHandler(support.StubHandler):
+    def do_POST(self):
+        self.read_body()
+        self.send_json({ "ok": True })
+
+class PooledSessionTest(unittest.TestCase):
+    def setUp(self):
+        client.configure(pool_size=2)
+
+    def tearDown(self):
+        client.close()
+
+    def test_consecutive_calls_reuse_one_connection(self):
+        with support.StubServer(EchoHandler) as server:
+            for _ in range(5):
+                response = client.post(f"{server.url}/v1/chat", json={ "prompt": "hi" }, timeout=5)
+                self.assertEqual(response.json(), { "ok": True })
+
+            self.assertEqual(len(server.requests), 5)
+            self.assertEqual(server.connections, 1)
+
+    def test_parallel_calls_stay_within_the_pool(self):
+        with support.StubServer(EchoHandler) as server:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                responses = list(executor.map(
+                    lambda _: client.post(f"{server.url}/v1/chat", json={}, timeout=5).status_code,
+                    range(20)
+                ))
+
+            self.assertEqual(responses, [200] * 20)
+            self.assertLessEqual(server.connections, 2)
+
+    def test_timings_of_new_connections(self):
+        lookups = []
+        getaddrinfo = socket.getaddrinfo
+
+        def counting_getaddrinfo(*args, **kwargs):
+            lookups.append(args[0])
+            return getaddrinfo(*args, **kwargs)
+
+        with support.StubServer(EchoHandler) as server, mock.patch("socket.getaddrinfo", counting_getaddrinfo):
+            url = f"http://localhost:{server.server_address[1]}/v1/chat"
+            client.post(url, json={}, timeout=5)
+            first = client.get_timings()
+            client.post(url, json={}, timeout=5)
+            second = client.get_timings()
+
+        # Only urllib3 resolves the host, once for the one connection
+        self.assertEqual(lookups, ["localhost"])
+        self.assertEqual(set(first), { "connect", "ttfb" })
+        self.assertEqual(set(second), { "ttfb" })
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import threading
+import unittest
+from unittest import mock
+
+import support
+import diff_chunker
+import generate_changelog
+
+MODEL = "openai/gpt-4.1"
+FILES = 200
+LINES_PER_FILE = 250
+
+def synthetic_diff(files=FILES, lines_per_file=LINES_PER_FILE, files_per_commit=10):
+    parts = []
+    for i in range(files):
+        if i % files_per_commit == 0:
+            parts.append(f"# Commit {i:07x}: Rework feature widgets {i} and up\n")
+            parts.append(f"# Files left out of this diff:\n# lib/feature_{i}/widget.g.dart (+900 -0, generated)\n")
+        parts.append(f"diff --git a/lib/feature_{i}/widget.dart b/lib/feature_{i}/widget.dart\n")
+        parts.append(f"--- a/lib/feature_{i}/widget.dart\n+++ b/lib/feature_{i}/widget.dart\n")
+        for hunk in range(0, lines_per_file, 50):
+            parts.append(f"@@ -{hunk + 1},50 +{hunk + 1},50 @@\n")
+            parts.extend(f"+  final value{j} = compute({i}, {j}); // line {j}\n" for j in range(hunk, hunk + 50))
+    return "".join(parts)
+
+def synthetic_commit_info(files=FILES):
+    lines = ["Commits:", "- 1a2b3c4 Rework the feature widgets (Jane Doe)", "Changed files:"]
+    lines.extend(f"lib/feature_{i}/widget.dart (+{LINES_PER_FILE} -0)" for i in range(files))
+    return "\n".join(lines)
+
+# Join the chunks again, without the commit headers repeated in front of chunks that continue a commit
+def drop_repeated_headers(chunks):
+    parts = []
+    last_commit = None
+    for chunk in chunks:
+        header, _, rest = chunk.partition("diff --git ")
+        commit = header.splitlines()[0] if header else None
+        parts.append(chunk if commit != last_commit else "diff --git " + rest)
+        last_commit = [line for line in chunk.splitlines() if line.startswith("# Commit ")][-1]
+    return "".join(parts)
+
+# Records the prompts and answers with a short summary
+class StubProvider:
+    def __init__(self):
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def generate_text(self, provider, model, system_instruction, command, stream_file=None, cancel_event=None, context=None):
+        with self.lock:
+            self.prompts.append({ "system_instruction": system_instruction, "context": context, "command": command, "stream_file": stream_file })
+            return { "error": False, "message": f"- Summary {len(self.prompts)}: reworked some feature widgets (Jane Doe)" }
+
+class GenerateTextTest(unittest.TestCase):
+    def generate(self, diff, commit_info, chunking="auto"):
+        stub = StubProvider()
+        with mock.patch.object(diff_chunker.providers, "generate_text", stub.generate_text):
+            response = diff_chunker.generate_text(
+                "openai",
+                MODEL,
+                diff,
+                lambda diff: generate_changelog.create_payload(commit_info, diff, "repo"),
+                lambda chunk: generate_changelog.create_chunk_payload(commit_info, chunk, "repo"),
+                lambda summaries: generate_changelog.create_reduce_payload(commit_info, summaries, "repo"),
+                chunking=chunking,
+                stream_file="stream.txt"
+            )
+        return response, stub.prompts
+
+    def test_every_prompt_of_a_large_diff_fits_the_budget(self):
+        diff = synthetic_diff()
+        self.assertEqual(diff.count("\n+  final"), FILES * LINES_PER_FILE)
+
+        response, prompts = self.generate(diff, synthetic_commit_info())
+
+        self.assertFalse(response["error"])
+        self.assertGreater(len(prompts), 2)
+        budget = diff_chunker.get_token_budget(MODEL)
+        for prompt in prompts:
+            self.assertLessEqual(diff_chunker.payload_tokens(prompt), budget)
+
+        # Every line of the diff is sent exactly once, only the final prompt is streamed
+        sent = "".join(prompt["command"] for prompt in prompts)
+        self.assertEqual(sent.count("final value"), FILES * LINES_PER_FILE)
+        self.assertEqual([prompt["stream_file"] for prompt in prompts].count("stream.txt"), 1)
+        self.assertEqual(prompts[-1]["stream_file"], "stream.txt")
+
+    def test_chunks_share_a_cacheable_prefix(self):
+        commit_info = synthetic_commit_info()
+        _, prompts = self.generate(synthetic_diff(), commit_info)
+
+        chunk_prompts = prompts[:-1]
+        self.assertEqual(len({ (prompt["system_instruction"], prompt["context"]) for prompt in chunk_prompts }), 1)
+        self.assertIn(commit_info, chunk_prompts[0]["context"])
+        self.assertNotIn(commit_info, chunk_prompts[0]["command"])
+        # Providers only cache prefixes of at least 1024 tokens
+        self.assertGreaterEqual(diff_chunker.estimate_tokens(chunk_prompts[0]["system_instruction"] + chunk_prompts[0]["context"]), 1024)
+
+    def test_auto_chunks_when_the_diff_only_fits_without_the_commit_info(self):
+        budget = diff_chunker.get_token_budget(MODEL)
+        diff = synthetic_diff(files=1, lines_per_file=400)
+        self.assertLess(diff_chunker.estimate_tokens(diff), budget)
+
+        _, prompts = self.generate(diff, synthetic_commit_info())
+
+        self.assertGreater(len(prompts), 1)
+        for prompt in prompts:
+            self.assertLessEqual(diff_chunker.payload_tokens(prompt), budget)
+
+    def test_small_diff_is_sent_in_one_prompt(self):
+        _, prompts = self.generate(synthetic_diff(files=1, lines_per_file=50), synthetic_commit_info(files=1))
+        self.assertEqual(len(prompts), 1)
+
+class ChunkDiffTest(unittest.TestCase):
+    def test_chunks_fit_and_keep_the_diff(self):
+        diff = synthetic_diff(files=20)
+        chunks = diff_chunker.chunk_diff(diff, 5000)
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            self.assertLessEqual(diff_chunker.estimate_tokens(chunk), 5000)
+
+        self.assertEqual(drop_repeated_headers(chunks), diff)
+
+    def test_every_chunk_starts_with_its_commit_header(self):
+        diff = synthetic_diff(files=8, lines_per_file=50, files_per_commit=4)
+        chunks = diff_chunker.chunk_diff(diff, 1000)
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith("# Commit "))
+            self.assertLessEqual(diff_chunker.estimate_tokens(chunk), 1000)
+        self.assertTrue(all(chunk.startswith("# Commit 0000004") for chunk in chunks if "feature_6/" in chunk))
+        self.assertEqual(drop_repeated_headers(chunks), diff)
+
+    def test_oversized_hunks_repeat_the_file_header(self):
+        diff = synthetic_diff(files=1, lines_per_file=200)
+        chunks = diff_chunker.chunk_diff(diff, 500)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith("# Commit 0000000"))
+            self.assertIn("\ndiff --git a/lib/feature_0/widget.dart", chunk)
+
+if __name__ == "__main__":
+    unittest.main()
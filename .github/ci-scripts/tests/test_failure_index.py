@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+import support
+import failure_index
+import log_triage
+
+def gradle_failure(cause, duration="45s", run="1"):
+    return f"""Run flutter build appbundle --release
+Resolving dependencies... (2.{run}s)
+Got dependencies!
+Running Gradle task 'bundleRelease'...
+
+FAILURE: Build failed with an exception.
+
+* What went wrong:
+{cause}
+
+* Try:
+> Run with --stacktrace option to get the stack trace.
+> Run with --info or --debug option to get more log output.
+> Run with --scan to get full insights.
+> Get more help at https://help.gradle.org.
+
+BUILD FAILED in {duration}
+Running Gradle task 'bundleRelease'...                             4{run}.3s
+Gradle task bundleRelease failed with exit code 1
+Error: Process completed with exit code 1.
+"""
+
+def keystore_failure(run="1"):
+    return gradle_failure(
+        f"Execution failed for task ':app:validateSigningRelease'.\n"
+        f"> Keystore file '/home/runner/work/app-{run}/android/app/upload-keystore.jks' not found for signing config 'release'.",
+        run=run
+    )
+
+def dependency_failure(run="1"):
+    return gradle_failure(
+        "Execution failed for task ':app:checkReleaseAarMetadata'.\n"
+        "> Could not resolve all files for configuration ':app:releaseRuntimeClasspath'.\n"
+        f"   > Could not find com.example:analytics:{run}.4.2.\n"
+        "     Required by:\n"
+        "         project :app",
+        run=run
+    )
+
+class FingerprintTest(unittest.TestCase):
+    def test_generic_gradle_lines_are_left_out(self):
+        lines = failure_index.error_lines(keystore_failure())
+        self.assertEqual(lines, [
+            "Execution failed for task ':app:validateSigningRelease'.",
+            "> Keystore file 'upload-keystore.jks' not found for signing config 'release'."
+        ])
+
+    def test_different_causes_do_not_match(self):
+        for logs in [lambda logs: logs, log_triage.triage_text]:
+            keystore = failure_index.fingerprint(logs(keystore_failure()))
+            dependency = failure_index.fingerprint(logs(dependency_failure()))
+            self.assertLess(failure_index.similarity(keystore["minhash"], dependency["minhash"]), 0.5)
+
+    def test_the_same_cause_matches_across_runs(self):
+        first = failure_index.fingerprint(log_triage.triage_text(dependency_failure(run="1")))
+        second = failure_index.fingerprint(log_triage.triage_text(dependency_failure(run="7")))
+        self.assertEqual(first["hash"], second["hash"])
+
+    def test_only_generic_lines_give_no_fingerprint(self):
+        logs = "Running Gradle task 'bundleRelease'...\nBUILD FAILED in 12s\nGradle task bundleRelease failed with exit code 1\nError: Process completed with exit code 1.\n"
+        self.assertIsNone(failure_index.fingerprint(logs))
+        self.assertIsNone(failure_index.fingerprint(gradle_failure("")))
+
+    def test_specific_error_lines_are_kept(self):
+        logs = "lib/main.dart:12:7: Error: The getter 'titel' isn't defined for the class 'Post'.\n\nError: Process completed with exit code 1.\n"
+        self.assertEqual(failure_index.error_lines(logs), ["main.dart:#:#: Error: The getter 'titel' isn't defined for the class 'Post'."])
+
+class FailureIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "failure-index.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_reuses_only_the_analysis_of_the_same_cause(self):
+        index = failure_index.FailureIndex(self.path)
+        index.add(failure_index.fingerprint(dependency_failure()), "Publish com.example:analytics first.", "1")
+        index.save()
+
+        index = failure_index.FailureIndex(self.path)
+        self.assertIsNone(index.find(failure_index.fingerprint(keystore_failure())))
+        entry, entry_similarity = index.find(failure_index.fingerprint(dependency_failure(run="3")))
+        self.assertEqual(entry["analysis"], "Publish com.example:analytics first.")
+        self.assertEqual(entry_similarity, 1.0)
+
+    def test_drops_the_entries_of_older_index_versions(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write('{"entries": [{"hash": "old", "minhash": [], "analysis": "Old analysis"}]}')
+        self.assertEqual(failure_index.FailureIndex(self.path).entries, [])
+
+if __name__ == "__main__":
+    unittest.main()
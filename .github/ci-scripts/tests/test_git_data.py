@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import support
+import git_data
+
+class ExtractTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.repo_path = Path(self.temp_dir.name) / "repo"
+        self.repo_path.mkdir()
+        support.git(self.repo_path, "init", "--quiet", "--initial-branch", "main")
+        self.commit({ "README.md": "# Readme\n" }, "Initial commit")
+        self.commit({ "lib/main.dart": "void main() {}\n", "assets/data.bin": b"\0\1\2\3", "assets/logo.png": b"\x89PNG\0\1" }, "Add the app")
+        self.commit({ "lib/main.dart": "void main() { run(); }\n" }, "Run the app")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def commit(self, files, message):
+        for name, content in files.items():
+            path = self.repo_path / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(content, bytes):
+                path.write_bytes(content)
+            else:
+                path.write_text(content)
+        support.git(self.repo_path, "add", "-A")
+        support.git(self.repo_path, "commit", "--quiet", "-m", message)
+
+    def extract(self):
+        diff_path = os.path.join(self.temp_dir.name, "diff.txt")
+        context = git_data.extract("HEAD~2..HEAD", diff_path, repo_path=self.repo_path)
+        with open(diff_path, "r", encoding="utf-8") as f:
+            return context, f.read()
+
+    def test_one_patch_per_commit_in_date_order(self):
+        context, diff = self.extract()
+
+        self.assertEqual([commit["message"] for commit in context["commits"]], ["Run the app", "Add the app"])
+        headers = [line for line in diff.splitlines() if line.startswith("# Commit ")]
+        self.assertEqual([header.split(": ", 1)[1] for header in headers], ["Add the app", "Run the app"])
+        self.assertLess(diff.index("+void main() {}"), diff.index("+void main() { run(); }"))
+
+    def test_filtered_files_are_listed_once_with_their_reason(self):
+        context, diff = self.extract()
+
+        self.assertIn("# assets/data.bin (binary)\n", diff)
+        self.assertIn("# assets/logo.png (binary, excluded)\n", diff)
+        self.assertNotIn("diff --git a/assets/", diff)
+        self.assertEqual(context["files"]["lib/main.dart"]["added"], 2)
+        self.assertTrue(context["files"]["assets/data.bin"]["binary"])
+
+if __name__ == "__main__":
+    unittest.main()
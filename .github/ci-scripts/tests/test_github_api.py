@@ -0,0 +1,113 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+import support
+import generate_git_context
+import github_api
+
+RUNS_PATH = "/repos/owner/repo/actions/workflows/build.yml/runs"
+PAGES = 3
+PER_PAGE = 10
+
+def workflow_run(number):
+    return { "id": 1000 + number, "run_number": number, "created_at": "2024-01-01T00:00:00Z", "head_sha": f"{number:040x}" }
+
+# Paginated workflow runs with ETags, and a rate limited endpoint
+class GitHubHandler(support.StubHandler):
+    def do_GET(self):
+        self.read_body()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == RUNS_PATH:
+            page = int(query.get("page", ["1"])[0])
+            etag = f'"runs-{page}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            start = PAGES * PER_PAGE - (page - 1) * PER_PAGE
+            runs = [workflow_run(number) for number in range(start, start - PER_PAGE, -1)]
+            headers = { "ETag": etag, "x-ratelimit-remaining": "4000" }
+            if page < PAGES:
+                headers["Link"] = f'<{self.server.url}{RUNS_PATH}?per_page={PER_PAGE}&page={page + 1}>; rel="next"'
+            self.send_json({ "total_count": PAGES * PER_PAGE, "workflow_runs": runs }, headers=headers)
+        elif url.path == "/limited":
+            # Rate limited on the first request
+            with self.server.lock:
+                self.server.limited_calls = getattr(self.server, "limited_calls", 0) + 1
+                first = self.server.limited_calls == 1
+            if first:
+                self.send_json({ "message": "API rate limit exceeded" }, status=403, headers={ "Retry-After": "7" })
+            else:
+                self.send_json({ "ok": True })
+        elif url.path == "/exhausted":
+            reset = int(time.time()) + 3600
+            self.send_json({ "message": "API rate limit exceeded" }, status=403, headers={ "x-ratelimit-remaining": "0", "x-ratelimit-reset": str(reset) })
+        else:
+            self.send_json({ "message": "Not Found" }, status=404)
+
+class GitHubClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = support.StubServer(GitHubHandler).__enter__()
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        self.temp_dir.cleanup()
+
+    def create_client(self):
+        return github_api.GitHubClient("token", api_url=self.server.url, cache_dir=self.temp_dir.name)
+
+    def test_pagination_stops_with_the_iteration(self):
+        environ = { "GITHUB_REPOSITORY": "owner/repo", "GITHUB_RUN_ID": str(1000 + PAGES * PER_PAGE), "GITHUB_REF_NAME": "main" }
+        with mock.patch.dict(os.environ, environ):
+            sha = generate_git_context.find_last_successful_run("token", "build.yml", api_url=self.server.url, cache_dir=self.temp_dir.name)
+
+        # The newest run is the current one, the one before it is on the first page
+        self.assertEqual(sha, workflow_run(PAGES * PER_PAGE - 1)["head_sha"])
+        self.assertEqual([request["path"] for request in self.server.requests], [f"{RUNS_PATH}?branch=main&status=success&per_page={PER_PAGE}"])
+        self.assertEqual(self.server.requests[0]["headers"]["Authorization"], "Bearer token")
+
+    def test_pagination_follows_the_link_headers(self):
+        runs = list(self.create_client().paginate(RUNS_PATH, { "per_page": PER_PAGE }, "workflow_runs"))
+        self.assertEqual([run["run_number"] for run in runs], list(range(PAGES * PER_PAGE, 0, -1)))
+        self.assertEqual(len(self.server.requests), PAGES)
+
+    def test_unchanged_pages_come_from_the_cache(self):
+        first = list(self.create_client().paginate(RUNS_PATH, { "per_page": PER_PAGE }, "workflow_runs"))
+        second = list(self.create_client().paginate(RUNS_PATH, { "per_page": PER_PAGE }, "workflow_runs"))
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.requests), 2 * PAGES)
+        revalidations = self.server.requests[PAGES:]
+        self.assertEqual([request["headers"].get("If-None-Match") for request in revalidations], [f'"runs-{page}"' for page in range(1, PAGES + 1)])
+
+    def test_waits_for_a_rate_limit(self):
+        with mock.patch.object(github_api.time, "sleep") as sleep:
+            body, next_url = self.create_client().get("/limited")
+
+        self.assertEqual(body, { "ok": True })
+        self.assertIsNone(next_url)
+        sleep.assert_called_once_with(7)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_does_not_wait_for_a_distant_reset(self):
+        with mock.patch.object(github_api.time, "sleep") as sleep:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.create_client().get("/exhausted")
+
+        sleep.assert_not_called()
+        self.assertEqual(len(self.server.requests), 1)
+
+if __name__ == "__main__":
+    unittest.main()
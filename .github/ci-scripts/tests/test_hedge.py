@@ -0,0 +1,66 @@
+import subprocess
+import sys
+import textwrap
+import time
+import unittest
+
+import support
+from ai import hedge
+
+# Hedges a slow provider whose chunk requests hang with a fast one, then exits
+CHILD = textwrap.dedent("""
+    import sys, time
+    sys.path.insert(0, {scripts_dir!r})
+    import diff_chunker, helpers
+    from ai import hedge
+
+    helpers.configure(level="error")
+
+    def generate_text(provider, model, system_instruction, command, stream_file=None, cancel_event=None, context=None):
+        if provider == "slow":
+            time.sleep({hang})
+        return {{ "error": False, "message": provider }}
+
+    diff_chunker.providers.generate_text = generate_text
+    diff = "".join(f"diff --git a/f{{i}} b/f{{i}}\\n" + "+line\\n" * 2000 for i in range(4))
+    payload = lambda text: {{ "system_instruction": "Summarise", "command": text if isinstance(text, str) else "\\n".join(text) }}
+    response = hedge.generate_text(
+        ["slow", "fast"],
+        lambda provider, cancel_event: diff_chunker.generate_text(
+            provider, "model", diff, payload, payload, payload,
+            chunking="always", max_chunk_tokens=4000, cancel_event=cancel_event
+        ),
+        hedge_delay=0.2
+    )
+    print(response["provider"])
+""")
+
+class HedgeTest(unittest.TestCase):
+    def test_first_success_wins(self):
+        calls = []
+
+        def generate(provider, cancel_event):
+            calls.append(provider)
+            if provider == "broken":
+                return { "error": True }
+            return { "error": False, "message": provider }
+
+        response = hedge.generate_text(["broken", "working"], generate, hedge_delay=5)
+        self.assertEqual(response["provider"], "working")
+        self.assertEqual(calls, ["broken", "working"])
+
+    def test_cancelled_chunk_requests_do_not_delay_the_exit(self):
+        hang = 30
+        start_time = time.monotonic()
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD.format(scripts_dir=support.SCRIPTS_DIR, hang=hang)],
+            capture_output=True, text=True, timeout=hang * 2
+        )
+        elapsed = time.monotonic() - start_time
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "fast")
+        self.assertLess(elapsed, hang / 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import argparse
+import unittest
+from unittest import mock
+
+import support
+import diff_chunker
+import generate_changelog
+import generate_code_review
+
+def pipeline_args(**overrides):
+    options = { "hedge_delay": 90, "chunking": "auto", "max_chunk_tokens": None, "stream": False }
+    options.update(overrides)
+    return argparse.Namespace(**options)
+
+class GenerateTest(unittest.TestCase):
+    def setUp(self):
+        self.prompts = []
+        patcher = mock.patch.object(diff_chunker.providers, "generate_text", self.generate_text)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate_text(self, provider, model, system_instruction, command, stream_file=None, cancel_event=None, context=None):
+        self.prompts.append({ "provider": provider, "model": model, "context": context, "command": command, "stream_file": stream_file })
+        return { "error": False, "message": f"Answer of {provider}" }
+
+    def test_changelog(self):
+        response = generate_changelog.generate(["openai"], "Commit: 1a2b3c4", "diff --git a/x b/x\n", "repo", pipeline_args(stream=True))
+
+        self.assertEqual(response["message"], "Answer of openai")
+        self.assertEqual(self.prompts[0]["model"], generate_changelog.MODELS["openai"])
+        self.assertIn("Commit: 1a2b3c4", self.prompts[0]["context"])
+        self.assertEqual(self.prompts[0]["stream_file"], generate_changelog.STREAM_FILE.format(provider="openai"))
+
+    def test_code_review_chunks_with_the_command_line_options(self):
+        diff = "".join(f"diff --git a/f{i} b/f{i}\n" + "+line\n" * 2000 for i in range(3))
+        response = generate_code_review.generate(["anthropic"], diff, "repo", pipeline_args(chunking="always", max_chunk_tokens=4000))
+
+        self.assertEqual(response["message"], "Answer of anthropic")
+        self.assertGreater(len(self.prompts), 2)
+        self.assertEqual({ prompt["model"] for prompt in self.prompts }, { generate_code_review.MODELS["anthropic"] })
+        self.assertEqual([prompt["stream_file"] for prompt in self.prompts], [None] * len(self.prompts))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+
+import support
+from ai import anthropic, cache, gemini, github_models, openai
+
+RESPONSES = {
+    "anthropic": { "content": [{ "text": "Answer" }], "usage": { "input_tokens": 10, "output_tokens": 2 } },
+    "openai": { "choices": [{ "message": { "content": "Answer" } }], "usage": { "prompt_tokens": 10, "completion_tokens": 2 } },
+    "gemini": { "candidates": [{ "content": { "parts": [{ "text": "Answer" }] } }], "usageMetadata": { "promptTokenCount": 10, "candidatesTokenCount": 2 } }
+}
+RESPONSES["github_models"] = RESPONSES["openai"]
+
+# Captures the request bodies the providers send instead of calling the APIs
+class RequestRecorder:
+    def __init__(self, provider):
+        self.provider = provider
+        self.payloads = []
+
+    def post(self, url, **kwargs):
+        self.payloads.append(kwargs["json"])
+        response = mock.Mock()
+        response.json.return_value = RESPONSES[self.provider]
+        return response
+
+class ContextTest(unittest.TestCase):
+    def setUp(self):
+        cache.configure(enabled=False)
+        self.addCleanup(cache.configure)
+
+    def send(self, module, provider, context):
+        recorder = RequestRecorder(provider)
+        with mock.patch.object(module.client, "post", recorder.post), mock.patch.object(module.telemetry, "record"):
+            response = module.send_request("Instructions", "Command", "key", "model", context=context)
+        self.assertEqual(response, { "error": False, "message": "Answer" })
+        return recorder.payloads[0]
+
+    def test_anthropic_cache_breakpoint_ends_on_the_context(self):
+        payload = self.send(anthropic, "anthropic", "Commits")
+        self.assertEqual(payload["system"], [{ "type": "text", "text": "Instructions" }])
+        self.assertEqual(payload["messages"][0]["content"], [
+            { "type": "text", "text": "Commits", "cache_control": { "type": "ephemeral" } },
+            { "type": "text", "text": "Command" }
+        ])
+
+    def test_anthropic_without_context_caches_the_instructions(self):
+        payload = self.send(anthropic, "anthropic", None)
+        self.assertEqual(payload["system"][0]["cache_control"], { "type": "ephemeral" })
+        self.assertEqual(payload["messages"][0]["content"], [{ "type": "text", "text": "Command" }])
+
+    def test_context_follows_the_instructions(self):
+        openai_payload = self.send(openai, "openai", "Commits")
+        self.assertEqual([part["text"] for part in openai_payload["messages"][1]["content"]], ["Commits", "Command"])
+
+        github_payload = self.send(github_models, "github_models", "Commits")
+        self.assertEqual(github_payload["messages"][1]["content"], "Commits\nCommand")
+
+        gemini_payload = self.send(gemini, "gemini", "Commits")
+        self.assertEqual(gemini_payload["contents"][0]["parts"], [{ "text": "Commits" }, { "text": "Command" }])
+
+    def test_context_is_part_of_the_cache_key(self):
+        key = cache.make_key("openai", "model", "Instructions", "Command", {}, "Commits")
+        self.assertNotEqual(key, cache.make_key("openai", "model", "Instructions", "Command", {}, "Other commits"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import support
+from ai import client, openai
+
+def delta(text):
+    return { "choices": [{ "delta": { "content": text } }] }
+
+STREAMS = {
+    "/complete": [delta("Hello "), delta("world"), { "choices": [], "usage": { "prompt_tokens": 3, "completion_tokens": 2 } }, "[DONE]"],
+    "/malformed": [delta("Hello "), { "choices": [{ "index": 0 }] }, delta("never sent")],
+    "/wrong-type": [delta("Hello "), { "choices": "unexpected" }],
+    "/empty-choice": [delta("Hello "), { "choices": [None] }],
+    "/dropped": [delta("Hello "), delta("wor")]
+}
+
+# Streams the events of the requested path as server-sent events, one chunk per event
+class SSEHandler(support.StubHandler):
+    def do_POST(self):
+        self.read_body()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        try:
+            for event in STREAMS[self.path]:
+                data = event if isinstance(event, str) else json.dumps(event)
+                self.write_chunk(f"data: {data}\n\n")
+                time.sleep(0.01)
+
+            if self.path == "/dropped":
+                # Break off without the last chunk
+                self.close_connection = True
+                return
+            self.write_chunk("")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading
+            self.close_connection = True
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+class StreamTextTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.StubServer(SSEHandler).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+
+    def setUp(self):
+        client.configure(pool_size=1)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.stream_file = os.path.join(self.temp_dir.name, "stream.txt")
+
+    def tearDown(self):
+        client.close()
+        self.temp_dir.cleanup()
+
+    def stream(self, path, cancel_event=None):
+        start_time = time.monotonic()
+        response = client.post(f"{self.server.url}{path}", json={ "stream": True }, stream=True, timeout=5)
+        return client.stream_text(response, self.stream_file, openai.parse_stream_event, start_time, cancel_event)
+
+    def read_stream_file(self):
+        with open(self.stream_file, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def test_complete_stream(self):
+        message, usage = self.stream("/complete")
+        self.assertEqual(message, "Hello world")
+        self.assertEqual(usage, { "prompt_tokens": 3, "completion_tokens": 2 })
+        self.assertEqual(self.read_stream_file(), "Hello world")
+        self.assertIn("ttft", client.get_timings())
+
+    def test_unexpected_events_keep_the_partial_text(self):
+        for path in ["/malformed", "/wrong-type", "/empty-choice"]:
+            with self.subTest(path=path):
+                with self.assertRaises(client.StreamError) as context:
+                    self.stream(path)
+                self.assertEqual(context.exception.partial_message, "Hello ")
+                self.assertEqual(self.read_stream_file(), "Hello ")
+
+    def test_dropped_connection_keeps_the_partial_text(self):
+        with self.assertRaises(client.StreamError) as context:
+            self.stream("/dropped")
+        self.assertEqual(context.exception.partial_message, "Hello wor")
+
+    def test_cancelled_stream(self):
+        cancel_event = threading.Event()
+        cancel_event.set()
+        with self.assertRaises(client.StreamError) as context:
+            self.stream("/complete", cancel_event)
+        self.assertEqual(str(context.exception), "Stream cancelled")
+        self.assertEqual(context.exception.partial_message, "")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import support
+import update_wiki
+
+# A wiki with some history, the pages are random so they do not compress
+PAGE_SIZE = 20000
+
+def wiki_pages(count=40, size=PAGE_SIZE):
+    rng = random.Random(count)
+    pages = { f"Changelog-2024010{i % 9 + 1}-{i:07x}.md": rng.randbytes(size // 2).hex() for i in range(count) }
+    pages["Home.md"] = "# Home\n"
+    pages["_Sidebar.md"] = "## **Semo**\n"
+    return pages
+
+def build_commit_info(index):
+    return {
+        "full_hash": f"{index:040x}",
+        "short_hash": f"{index:07x}",
+        "author": "Test",
+        "message": f"Build {index}",
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S +0000")
+    }
+
+# Document one successful build like a separate workflow run, in its own process
+def publish_build(remote_url, index):
+    # Keep the output of git quiet
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    # Many writers race for the same branch, retry quickly and more often than a real run
+    update_wiki.PUSH_BASE_DELAY = 0.05
+    update_wiki.PUSH_MAX_DELAY = 0.5
+    update_wiki.PUSH_ATTEMPTS = 30
+
+    updater = update_wiki.WikiUpdater("token", "owner/repo")
+    updater.wiki_url = remote_url
+    commit_info = build_commit_info(index)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        updater.clone_wiki(Path(temp_dir))
+        pages = {
+            "changelog_path": updater.create_changelog_page(commit_info, f"Changes of build {index}"),
+            "code_review_path": updater.create_code_review_page(commit_info, f"Review of build {index}")
+        }
+        updater.publish(pages.values(), updater.create_sidebar_entries(commit_info, **pages), commit_info, pages, updater.create_commit_message(commit_info))
+    return pages
+
+class WikiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.remote = support.WikiRemote(self.temp_dir.name, wiki_pages())
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create_updater(self, clone_mode="sparse", wiki_dir=None):
+        updater = update_wiki.WikiUpdater("token", "owner/repo", clone_mode=clone_mode, wiki_dir=wiki_dir)
+        updater.wiki_url = self.remote.url
+        return updater
+
+class PersistentCheckoutTest(WikiTestCase):
+    def test_persistent_checkout_only_fetches_new_commits(self):
+        for clone_mode in ["shallow", "sparse", "full"]:
+            with self.subTest(clone_mode=clone_mode):
+                wiki_dir = self.root / f"wiki-{clone_mode}"
+                self.create_updater(clone_mode, str(wiki_dir)).clone_wiki(self.root)
+                cloned_bytes = support.object_bytes(wiki_dir)
+                # Survives as long as the checkout is reused instead of cloned again
+                (wiki_dir / ".git" / "reused").touch()
+                # Left behind by a failed run
+                (wiki_dir / "Home.md").write_text("half written")
+                (wiki_dir / "Review-20240101-abcdef0.md").write_text("never pushed")
+
+                self.remote.commit({ f"Changelog-20240201-{clone_mode}.md": "# New page\n" })
+                updater = self.create_updater(clone_mode, str(wiki_dir))
+                self.assertEqual(updater.clone_wiki(self.root), wiki_dir)
+
+                fetched_bytes = support.object_bytes(wiki_dir) - cloned_bytes
+                self.assertTrue((wiki_dir / ".git" / "reused").exists())
+                self.assertEqual(support.git(wiki_dir, "rev-parse", "HEAD"), self.remote.head())
+                self.assertEqual((wiki_dir / "Home.md").read_text(), "# Home\n")
+                self.assertFalse((wiki_dir / "Review-20240101-abcdef0.md").exists())
+                # Only the new commit, not the history or any of the existing pages
+                self.assertLess(fetched_bytes, PAGE_SIZE / 4)
+
+    def test_sparse_clone_transfers_only_the_sparse_files(self):
+        full_dir = self.root / "wiki-full"
+        sparse_dir = self.root / "wiki-sparse"
+        self.create_updater("full", str(full_dir)).clone_wiki(self.root)
+        self.create_updater("sparse", str(sparse_dir)).clone_wiki(self.root)
+
+        self.assertLess(support.object_bytes(sparse_dir), support.object_bytes(full_dir) / 20)
+        self.assertEqual(sorted(os.listdir(sparse_dir)), [".git", "Home.md", "_Sidebar.md"])
+
+class RemoteUrlTest(WikiTestCase):
+    def test_failing_remote_commands_do_not_leak_the_token(self):
+        updater = update_wiki.WikiUpdater("ghs_secret0token0secret0token0", "owner/repo")
+        # A checkout without an origin remote, so set-url fails
+        checkout = self.root / "checkout"
+        checkout.mkdir()
+        support.git(checkout, "init", "--quiet")
+
+        with self.assertRaises(subprocess.CalledProcessError) as raised:
+            updater.set_remote_url(checkout)
+        self.assertNotIn("secret0token", str(raised.exception))
+        self.assertNotIn("secret0token", raised.exception.stderr)
+        self.assertIn("x-access-token:***@github.com", str(raised.exception))
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertFalse(updater.fetch_wiki(checkout))
+        self.assertIn("Could not update the wiki checkout", stdout.getvalue())
+        self.assertNotIn("secret0token", stdout.getvalue())
+
+class PublishTest(WikiTestCase):
+    WRITERS = 6
+
+    def test_parallel_writers_keep_all_entries(self):
+        with ProcessPoolExecutor(max_workers=self.WRITERS) as executor:
+            results = list(executor.map(publish_build, [self.remote.url] * self.WRITERS, range(1, self.WRITERS + 1)))
+
+        files = self.remote.files()
+        sidebar = self.remote.read("_Sidebar.md")
+        month = datetime.now().strftime("%Y-%m")
+        index = [json.loads(line) for line in self.remote.read(f"sidebar-index/{month}.jsonl").splitlines()]
+        archive = self.remote.read(f"Archive-{month}.md")
+
+        for pages in results:
+            for page in pages.values():
+                self.assertIn(page, files)
+                self.assertIn(f"({page[:-len('.md')]})", sidebar)
+                self.assertIn(f"({page[:-len('.md')]})", archive)
+        self.assertEqual(len(index), 2 * self.WRITERS)
+        self.assertEqual(len({ entry["page"] for entry in index }), 2 * self.WRITERS)
+
+class ConcurrentUpdatersTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+
+        # The repository whose builds are documented, with the generated texts of one build
+        self.repo_path = self.root / "repo"
+        self.repo_path.mkdir()
+        support.git(self.repo_path, "init", "--quiet", "--initial-branch", "main")
+        (self.repo_path / "changelog.json").write_text(json.dumps({ "changelog": "Added the feature" }))
+        (self.repo_path / "code_review.json").write_text(json.dumps({ "code_review": "No critical issues" }))
+        support.git(self.repo_path, "add", "-A")
+        support.git(self.repo_path, "commit", "--quiet", "-m", "Add the feature")
+        self.commit_hash = support.git(self.repo_path, "rev-parse", "HEAD")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def update(self, name, clone_mode):
+        (self.root / name).mkdir()
+        remote = support.WikiRemote(str(self.root / name), { "Home.md": f"# {name}\n" })
+        updater = update_wiki.WikiUpdater("token", f"owner/{name}", clone_mode=clone_mode, repo_path=str(self.repo_path))
+        updater.wiki_url = remote.url
+        updater.handle_success(self.commit_hash, "changelog.json", "code_review.json")
+        return remote
+
+    def test_two_wikis_updated_in_parallel(self):
+        cwd_before = sorted(os.listdir(os.getcwd()))
+        with support.quiet_stdout(), ThreadPoolExecutor(max_workers=2) as executor:
+            remotes = list(executor.map(self.update, ["first", "second"], ["sparse", "full"]))
+
+        # Nothing is written relative to the working directory of the process
+        self.assertEqual(sorted(os.listdir(os.getcwd())), cwd_before)
+
+        short_hash = self.commit_hash[:7]
+        month = datetime.now().strftime("%Y-%m")
+        for name, remote in zip(["first", "second"], remotes):
+            files = remote.files()
+            changelog = next(path for path in files if path.startswith("Changelog-") and path.endswith(f"-{short_hash}.md"))
+            review = next(path for path in files if path.startswith("Review-") and path.endswith(f"-{short_hash}.md"))
+            self.assertIn(f"Archive-{month}.md", files)
+            self.assertIn(f"sidebar-index/{month}.jsonl", files)
+
+            self.assertIn("Added the feature", remote.read(changelog))
+            self.assertIn(f"github.com/owner/{name}/commit/{self.commit_hash}", remote.read(changelog))
+            self.assertIn("No critical issues", remote.read(review))
+            for page in ["_Sidebar.md", f"Archive-{month}.md"]:
+                content = remote.read(page)
+                self.assertIn(f"({changelog[:-len('.md')]})", content)
+                self.assertIn(f"({review[:-len('.md')]})", content)
+            self.assertIn(f"[Latest Changelog]({changelog[:-len('.md')]})", remote.read("Home.md"))
+
+if __name__ == "__main__":
+    unittest.main()